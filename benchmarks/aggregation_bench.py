@@ -0,0 +1,145 @@
+"""Сравнение пути отчёта (суммы в SQL + aggregation.from_totals) с прежними циклами Python.
+
+Запуск из корня проекта:
+    python benchmarks/aggregation_bench.py [число_строк]
+
+Данные пишутся во временную БД через ledger, как это делает бот.
+"""
+import asyncio
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from itertools import groupby
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CATEGORIES = [("Зарплата", "income"), ("Подарки", "income"), ("Еда", "expense"),
+              ("Транспорт", "expense"), ("Покупки", "expense"), ("Жильё", "expense")]
+USER_ID = 1
+START, END = "2022-01-01", "2024-12-31"
+
+
+def synthetic_rows(n: int, seed: int = 0) -> list:
+    """n строк (день, тип, категория, сумма) за ~3 года, отсортированных по дню"""
+    rng = random.Random(seed)
+    start = date(2022, 1, 1)
+    days = [(start + timedelta(days=d)).isoformat() for d in range(3 * 365)]
+    offsets = sorted(rng.randrange(3 * 365) for _ in range(n))
+    rows = []
+    for offset in offsets:
+        category, type_ = rng.choice(CATEGORIES)
+        rows.append((days[offset], type_, category, round(rng.uniform(10, 5000), 2)))
+    return rows
+
+
+def fill_database(rows: list) -> None:
+    """Запись строк пачками по (день, тип) через ledger.add_transactions"""
+    from utils import database, ledger
+
+    database.init_db()
+    database.execute("INSERT OR IGNORE INTO users (user_id) VALUES (?)", (USER_ID,))
+    batches = groupby(sorted(rows, key=lambda row: (row[0], row[1])), key=lambda row: (row[0], row[1]))
+    with database.transaction() as cur:
+        for (day, type_), batch in batches:
+            items = [(category, amount, None) for _, _, category, amount in batch]
+            ledger.add_transactions(cur, USER_ID, type_, items, day)
+
+
+def loop_aggregate(rows: list) -> dict:
+    """Прежний способ: отдельные проходы со strptime на каждой строке"""
+    total_income = sum(a for _, t, _, a in rows if t == "income")
+    total_expense = sum(a for _, t, _, a in rows if t == "expense")
+
+    monthly_income, monthly_expense = defaultdict(float), defaultdict(float)
+    months = []
+    for day, type_, _, amount in rows:
+        month = datetime.strptime(day, "%Y-%m-%d").strftime("%b %Y")
+        if not months or months[-1] != month:
+            months.append(month)
+        (monthly_income if type_ == "income" else monthly_expense)[month] += amount
+
+    daily_income, daily_expense = defaultdict(float), defaultdict(float)
+    for day, type_, _, amount in rows:
+        label = datetime.strptime(day, "%Y-%m-%d").strftime("%d.%m.%Y")
+        (daily_income if type_ == "income" else daily_expense)[label] += amount
+    days = sorted(set(daily_income) | set(daily_expense), key=lambda d: datetime.strptime(d, "%d.%m.%Y"))
+
+    cumulative, running = [], 0.0
+    for d in days:
+        running += daily_income[d] - daily_expense[d]
+        cumulative.append(running)
+    return {"total_income": total_income, "total_expense": total_expense, "months": months,
+            "days": days, "cumulative_daily": cumulative}
+
+
+async def old_path() -> dict:
+    """Все строки периода в Python и циклы по ним"""
+    from utils import db
+
+    rows = await db.fetchall('''
+        SELECT t.day, c.type, c.name, t.amount
+        FROM transactions t JOIN categories c ON t.category_id = c.id
+        WHERE t.user_id = ? AND t.day BETWEEN ? AND ?
+        ORDER BY t.day
+    ''', (USER_ID, START, END))
+    return loop_aggregate(rows)
+
+
+async def report_path():
+    """Путь handlers/reports.py: группировка в SQLite, ряды из готовых итогов"""
+    from utils import aggregation, report_queries
+
+    daily_rows, monthly_rows = await asyncio.gather(
+        report_queries.totals_by_day(USER_ID, START, END),
+        report_queries.totals_by_month(USER_ID, START, END),
+    )
+    return aggregation.from_totals(daily_rows, monthly_rows)
+
+
+async def timed(coro_func):
+    started = time.perf_counter()
+    result = await coro_func()
+    return result, time.perf_counter() - started
+
+
+async def run(n: int) -> None:
+    from utils import database, db
+
+    rows = synthetic_rows(n)
+    print(f"Строк: {n}")
+    fill_database(rows)
+    try:
+        expected, loop_time = await timed(old_path)
+        series, report_time = await timed(report_path)
+    finally:
+        db.shutdown()
+        database.close_pool()
+
+    assert series.month_labels == expected["months"]
+    assert series.day_labels == expected["days"]
+    assert math.isclose(series.total_income, expected["total_income"])
+    assert math.isclose(series.total_expense, expected["total_expense"])
+    assert len(series.cumulative_daily) == len(expected["cumulative_daily"])
+    assert all(math.isclose(a, b, abs_tol=1e-6)
+               for a, b in zip(series.cumulative_daily, expected["cumulative_daily"]))
+
+    print(f"Строки + циклы Python: {loop_time:8.3f} с")
+    print(f"SQL-итоги:              {report_time:8.3f} с  (x{loop_time / report_time:.1f})")
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    with tempfile.TemporaryDirectory() as tmp:
+        # Путь к БД читается при импорте utils.config
+        os.environ["DB_PATH"] = os.path.join(tmp, "bench.db")
+        asyncio.run(run(n))
+
+
+if __name__ == "__main__":
+    main()
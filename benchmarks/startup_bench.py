@@ -0,0 +1,84 @@
+"""Время запуска бота: импорт bot и создание диспетчера, по модулям - по python -X importtime.
+
+Запуск из корня проекта:
+    python benchmarks/startup_bench.py [--runs 5] [--budget-ms 0]
+
+Завершается с кодом 1, если при старте импортируется тяжёлый стек отчётов
+(numpy, matplotlib, reportlab) или медиана превышает --budget-ms.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Эти пакеты должны загружаться только при первом отчёте
+LAZY_PACKAGES = ("numpy", "matplotlib", "reportlab")
+
+
+# Замер в дочернем процессе: импорт модуля бота и создание диспетчера
+STARTUP_CODE = """
+import time
+started = time.perf_counter()
+import bot
+bot.create_dispatcher()
+print((time.perf_counter() - started) * 1000)
+"""
+
+
+def import_times() -> Tuple[float, List[Tuple[str, int, int]]]:
+    """Время запуска в мс и (модуль, собственное время мкс, накопленное время мкс) для одного запуска"""
+    env = dict(os.environ, BOT_TOKEN=os.environ.get("BOT_TOKEN", "1:bench"))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", STARTUP_CODE],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return float(result.stdout.split()[-1]), rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=0, help="0 - без ограничения")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    totals: List[float] = []
+    self_times: Dict[str, List[int]] = {}
+    loaded = set()
+    for _ in range(args.runs):
+        total_ms, rows = import_times()
+        totals.append(total_ms)
+        for name, self_us, _ in rows:
+            self_times.setdefault(name, []).append(self_us)
+            loaded.add(name.split(".")[0])
+
+    median = statistics.median(totals)
+    print(f"Запуск бота: медиана {median:.1f} мс, мин {min(totals):.1f} мс ({args.runs} запусков)")
+    print("Самые медленные модули (собственное время):")
+    slowest = sorted(self_times.items(), key=lambda item: statistics.median(item[1]), reverse=True)
+    for name, values in slowest[:args.top]:
+        print(f"  {statistics.median(values) / 1000:8.1f} мс  {name}")
+
+    failed = False
+    eager = [package for package in LAZY_PACKAGES if package in loaded]
+    if eager:
+        print(f"ОШИБКА: при старте импортируются {', '.join(eager)}")
+        failed = True
+    if args.budget_ms and median > args.budget_ms:
+        print(f"ОШИБКА: {median:.1f} мс больше бюджета {args.budget_ms:.1f} мс")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
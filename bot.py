@@ -1,47 +1,82 @@
 import os
-from aiogram import Bot, Dispatcher
+from typing import TYPE_CHECKING, Tuple
+
 from dotenv import load_dotenv
-from utils.database import init_db
-from handlers import (
-    base_router,
-    balance_router,
-    categories_router,
-    transactions_router,
-    wishlist_router, 
-    reports_router, 
-    menu_router, 
-    history_router 
-)
-
-
- 
+from utils import db, charts
+from utils.database import init_db, close_pool
+from utils.config import BOT_MODE, FSM_STORAGE, METRICS_ENABLED
+
+if TYPE_CHECKING:
+    from aiogram import Bot, Dispatcher
+
 # Загрузка переменных окружения
 load_dotenv()
 
-# Инициализация бота и диспетчера
-bot = Bot(token=os.getenv('BOT_TOKEN'))
-dp = Dispatcher()
 
-# Регистрация всех роутеров
-dp.include_router(base_router)
-dp.include_router(balance_router)
-dp.include_router(categories_router)
-dp.include_router(transactions_router)
-dp.include_router(wishlist_router)
-dp.include_router(reports_router)
-dp.include_router(menu_router)
-dp.include_router(history_router)
+# Процессы отрисовки (spawn) заново выполняют этот модуль как __mp_main__,
+# поэтому aiogram и обработчики импортируются только при создании диспетчера
+def create_dispatcher() -> Tuple["Bot", "Dispatcher"]:
+    """Инициализация бота и диспетчера со всеми роутерами"""
+    from aiogram import Bot, Dispatcher
+    from utils.fsm_storage import SQLiteStorage
+    from utils.event_isolation import UserEventIsolation
+    from utils.balance_cache import setup_balance_cache
+    from handlers import (
+        base_router,
+        balance_router,
+        categories_router,
+        transactions_router,
+        wishlist_router,
+        reports_router,
+        menu_router,
+        history_router
+    )
 
+    bot = Bot(token=os.getenv('BOT_TOKEN'))
+    # Состояния диалогов хранятся в БД и переживают перезапуск;
+    # обновления одного пользователя обрабатываются по очереди
+    dp = Dispatcher(
+        storage=SQLiteStorage() if FSM_STORAGE == "sqlite" else None,
+        events_isolation=UserEventIsolation()
+    )
 
-from utils.database import execute
+    # Регистрация всех роутеров
+    dp.include_router(base_router)
+    dp.include_router(balance_router)
+    dp.include_router(categories_router)
+    dp.include_router(transactions_router)
+    dp.include_router(wishlist_router)
+    dp.include_router(reports_router)
+    dp.include_router(menu_router)
+    dp.include_router(history_router)
 
+    # Балансы читаются из кэша, периодически сверяемого с БД
+    setup_balance_cache(dp)
 
+    # Метрики подключаются только при METRICS_ENABLED, иначе накладных расходов нет
+    if METRICS_ENABLED:
+        from utils.metrics import setup_metrics
+        setup_metrics(dp)
+
+    return bot, dp
 
 
 if __name__ == "__main__":
     # Инициализация БД
     init_db()
-    
+    bot, dp = create_dispatcher()
+
     # Запуск бота
     print("Бот запущен! 🚀")
-    dp.run_polling(bot)
\ No newline at end of file
+    try:
+        if BOT_MODE == "webhook":
+            from utils.webhook import run_webhook
+            run_webhook(dp, bot)
+        else:
+            dp.run_polling(bot)
+    finally:
+        # Останавливаем процессы отрисовки графиков
+        charts.shutdown()
+        # Дожидаемся запросов в потоках и закрываем пул соединений с БД
+        db.shutdown()
+        close_pool()
@@ -2,7 +2,8 @@ from aiogram import Router, types
 from aiogram.fsm.context import FSMContext
 from aiogram.filters import Command  # <-- Добавьте этот импорт
 from states import Form
-from utils.database import execute, fetchone
+from utils import db, ledger
+from utils.balance_cache import get_balance
 from keyboards import main_menu, cancel_button
 from utils.formating import format_amount
 
@@ -21,8 +22,7 @@ async def set_balance_finish(message: types.Message, state: FSMContext):
     
     try:
         balance = float(message.text.replace(',', '.'))
-        execute("UPDATE users SET balance = ? WHERE user_id = ?", 
-               (balance, message.from_user.id))
+        await db.transaction(ledger.set_balance, message.from_user.id, balance)
         await message.answer(f"✅ Баланс установлен: {format_amount(balance)} ₽", reply_markup=main_menu())
     except ValueError:
         await message.answer("❌ Введите число!")
@@ -30,6 +30,5 @@ async def set_balance_finish(message: types.Message, state: FSMContext):
 
 @router.message(Command("balance"))
 async def show_balance(message: types.Message):
-    balance = fetchone("SELECT balance FROM users WHERE user_id = ?", 
-                      (message.from_user.id,))[0]
+    balance = await get_balance(message.from_user.id)
     await message.answer(f"🏦 Текущий баланс: {format_amount(balance)} ₽")
\ No newline at end of file
@@ -1,13 +1,13 @@
 from aiogram import Router, types
 from aiogram.filters import Command
-from utils.database import execute
+from utils import db
 from keyboards import main_menu
 
 router = Router()
 
 @router.message(Command("start", "help"))
 async def start(message: types.Message):
-    execute("INSERT OR IGNORE INTO users (user_id) VALUES (?)", (message.from_user.id,))
+    await db.execute("INSERT OR IGNORE INTO users (user_id) VALUES (?)", (message.from_user.id,))
     await message.answer(
         "💰 Финансовый менеджер\n\n"
         "Основные команды:\n"
@@ -20,6 +20,7 @@ async def start(message: types.Message):
         "/add_expense - добавить расход\n"
         "/add_expense_list - массовое добавление расходов\n"
         "/delete_transactions - удаление транзакций\n"
+        "/delete_range - удаление операций за период\n"
         "/report - отчёт за период\n"
         "/monthly - автоотчёт за месяц\n"
         "/compare - сравнение месяцев\n"
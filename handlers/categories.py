@@ -1,8 +1,9 @@
+import sqlite3
 from aiogram import Router, types
 from aiogram.filters import Command  # <-- Добавьте этот импорт
 from aiogram.fsm.context import FSMContext
 from states import Form
-from utils.database import execute, fetchall, fetchone
+from utils import db, ledger, category_cache
 from keyboards import main_menu, cancel_button, category_type_keyboard, dynamic_list_keyboard
 
 router = Router()
@@ -36,9 +37,10 @@ async def add_category_name(message: types.Message, state: FSMContext):
     
     data = await state.get_data()
     try:
-        execute('''INSERT INTO categories (user_id, name, type)
+        await db.execute('''INSERT INTO categories (user_id, name, type)
                  VALUES (?, ?, ?)''',
                (message.from_user.id, message.text, data['category_type']))
+        category_cache.invalidate(message.from_user.id)
         await message.answer(f"✅ Категория '{message.text}' добавлена!", reply_markup=main_menu())
     except sqlite3.IntegrityError:
         await message.answer("❌ Такая категория уже существует!")
@@ -46,26 +48,20 @@ async def add_category_name(message: types.Message, state: FSMContext):
 
 @router.message(Command("categories"))
 async def show_categories(message: types.Message):
-    expenses = fetchall('''SELECT name, type FROM categories 
-                           WHERE user_id = ? and type = 'expense'
-                        ''',
-                        (message.from_user.id,))
-    incomes = fetchall('''SELECT name, type FROM categories 
-                           WHERE user_id = ? and type = 'income'
-                        ''',
-                        (message.from_user.id,))
+    expenses = await category_cache.get_names(message.from_user.id, 'expense')
+    incomes = await category_cache.get_names(message.from_user.id, 'income')
     if (not incomes and not expenses):
         return await message.answer("❌ У вас пока нет категорий!")
     
     text = "📂 Ваши категории:\n"
     if(incomes):
         text += "Доходы:\n"
-        for name, cat_type in incomes:
+        for name in incomes:
             text += f"- {name} {''}\n"
         text += "---------------\n"
 
     if(expenses):
-        for name, cat_type in expenses:
+        for name in expenses:
             text += f"- {name} {''}\n"
         
 
@@ -73,15 +69,10 @@ async def show_categories(message: types.Message):
 
 @router.message(Command("deletecategory"))
 async def delete_category_start(message: types.Message, state: FSMContext):
-    categories = fetchall(
-        "SELECT name FROM categories WHERE user_id = ?",
-        (message.from_user.id,)
-    )
-    
-    if not categories:
-        return await message.answer("❌ У вас пока нет категорий.")
+    category_names = await category_cache.get_names(message.from_user.id)
 
-    category_names = [name for (name,) in categories]
+    if not category_names:
+        return await message.answer("❌ У вас пока нет категорий.")
 
     await state.set_state(Form.DELETE_CATEGORY)
     await message.answer(
@@ -96,14 +87,12 @@ async def process_delete_category(message: types.Message, state: FSMContext):
         return await message.answer("Отменено.", reply_markup=main_menu())
     
     # Проверим наличие категории
-    category = fetchone(
-        "SELECT id FROM categories WHERE user_id = ? AND name = ?",
-        (message.from_user.id, message.text)
-    )
-    if not category:
+    category_id = await category_cache.get_id(message.from_user.id, message.text)
+    if category_id is None:
         return await message.answer("❌ Категория не найдена!")
 
     # Удалим
-    execute("DELETE FROM categories WHERE id = ?", (category[0],))
+    await db.transaction(ledger.delete_category, message.from_user.id, category_id)
+    category_cache.invalidate(message.from_user.id)
     await state.clear()
     await message.answer(f"✅ Категория '{message.text}' удалена!", reply_markup=main_menu())
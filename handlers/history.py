@@ -1,10 +1,11 @@
 from aiogram import Router, types
 from aiogram.filters import Command
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from utils.database import fetchall, fetchone
+from utils import db
 from utils.formating import format_amount
 from collections import defaultdict
 from datetime import datetime
+from typing import Optional, Tuple
 
 router = Router()
 
@@ -25,16 +26,43 @@ async def send_filter_choice(message: types.Message, page: int = 1):
     ])
     await message.answer("Выберите тип транзакций для просмотра:", reply_markup=keyboard)
 
-async def show_history_page(message: types.Message, user_id: int, page: int, filter_type: str = "all", edit: bool = False):
-    offset = (page - 1) * ITEMS_PER_PAGE
-
+def parse_page_callback(data: str) -> Tuple[str, int, Optional[str], Optional[Tuple[str, int]]]:
+    """Разбор history_page_{filter}_{page}_{направление}_{created_at}_{id}"""
+    _, _, filter_type, page_str, *rest = data.split("_", 4)
+    if not rest:
+        # Кнопки старого формата без курсора - начинаем с первой страницы
+        return filter_type, 1, None, None
+    direction, cursor = rest[0].split("_", 1)
+    created_at, tx_id = cursor.rsplit("_", 1)
+    return filter_type, int(page_str), direction, (created_at, int(tx_id))
+
+async def show_history_page(
+    message: types.Message,
+    user_id: int,
+    page: int,
+    filter_type: str = "all",
+    edit: bool = False,
+    direction: Optional[str] = None,
+    cursor: Optional[Tuple[str, int]] = None
+):
     # Формируем условие фильтра
     if filter_type == "all":
         where_clause = "WHERE t.user_id = ?"
-        params = (user_id, ITEMS_PER_PAGE, offset)
+        params = [user_id]
     else:
         where_clause = "WHERE t.user_id = ? AND c.type = ?"
-        params = (user_id, filter_type, ITEMS_PER_PAGE, offset)
+        params = [user_id, filter_type]
+
+    # Keyset-пагинация: вместо OFFSET продолжаем от (created_at, id) крайней записи
+    if cursor is not None and direction == "p":
+        where_clause += " AND (t.created_at > ? OR (t.created_at = ? AND t.id > ?))"
+        order = "ASC"
+    else:
+        if cursor is not None:
+            where_clause += " AND (t.created_at < ? OR (t.created_at = ? AND t.id < ?))"
+        order = "DESC"
+    if cursor is not None:
+        params += [cursor[0], cursor[0], cursor[1]]
 
     query = f'''
         SELECT 
@@ -42,22 +70,34 @@ async def show_history_page(message: types.Message, user_id: int, page: int, fil
             c.name as category,
             c.type,
             t.description,
-            strftime('%d.%m.%Y', t.created_at) as date
+            strftime('%d.%m.%Y', t.created_at) as date,
+            t.created_at,
+            t.id
         FROM transactions t
         JOIN categories c ON t.category_id = c.id
         {where_clause}
-        ORDER BY t.created_at DESC
-        LIMIT ? OFFSET ?
+        ORDER BY t.created_at {order}, t.id {order}
+        LIMIT ?
     '''
 
-    transactions = fetchall(query, params)
+    # Лишняя запись показывает, есть ли страница дальше
+    transactions = await db.fetchall(query, (*params, ITEMS_PER_PAGE + 1))
+    has_more = len(transactions) > ITEMS_PER_PAGE
+    transactions = transactions[:ITEMS_PER_PAGE]
+    if order == "ASC":
+        transactions.reverse()
+        has_next = True
+    else:
+        has_next = has_more
 
+    # Итоговое количество берём из счётчиков, которые ведёт utils/ledger.py
     if filter_type == "all":
-        total_count = fetchone("SELECT COUNT(*) FROM transactions WHERE user_id = ?", (user_id,))[0]
+        total_count = (await db.fetchone("SELECT SUM(count) FROM transaction_counts WHERE user_id = ?", (user_id,)))[0] or 0
     else:
-        total_count = fetchone("SELECT COUNT(*) FROM transactions t JOIN categories c ON t.category_id = c.id WHERE t.user_id = ? AND c.type = ?", (user_id, filter_type))[0]
+        row = await db.fetchone("SELECT count FROM transaction_counts WHERE user_id = ? AND type = ?", (user_id, filter_type))
+        total_count = row[0] if row else 0
 
-    total_pages = (total_count + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE or 1
+    total_pages = max((total_count + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE, page, 1)
 
     if not transactions:
         return await message.answer("\U0001F4ED Нет транзакций.")
@@ -66,7 +106,7 @@ async def show_history_page(message: types.Message, user_id: int, page: int, fil
     total_income = 0.0
     total_expense = 0.0
 
-    for amount, category, type_, description, date_str in transactions:
+    for amount, category, type_, description, date_str, _, _ in transactions:
         grouped[date_str].append((float(amount), category, type_, description))
 
     lines = [f"\U0001F4DE История транзакций (стр. {page}/{total_pages}) — Фильтр: {filter_type}:\n"]
@@ -89,11 +129,18 @@ async def show_history_page(message: types.Message, user_id: int, page: int, fil
     lines.append(f"{'Баланс':<20}: {format_amount(total_income - total_expense)} ₽")
 
     # Кнопки пагинации с сохранением фильтра
+    first, last = transactions[0], transactions[-1]
     buttons = []
     if page > 1:
-        buttons.append(InlineKeyboardButton(text="⬅️ Назад", callback_data=f"history_page_{filter_type}_{page - 1}"))
-    if page < total_pages:
-        buttons.append(InlineKeyboardButton(text="Вперёд ➡️", callback_data=f"history_page_{filter_type}_{page + 1}"))
+        buttons.append(InlineKeyboardButton(
+            text="⬅️ Назад",
+            callback_data=f"history_page_{filter_type}_{page - 1}_p_{first[5]}_{first[6]}"
+        ))
+    if has_next:
+        buttons.append(InlineKeyboardButton(
+            text="Вперёд ➡️",
+            callback_data=f"history_page_{filter_type}_{page + 1}_n_{last[5]}_{last[6]}"
+        ))
 
     markup = InlineKeyboardMarkup(inline_keyboard=[buttons] if buttons else [])
 
@@ -119,14 +166,15 @@ async def handle_filter_selection(callback: types.CallbackQuery):
 
 @router.callback_query(lambda c: c.data.startswith("history_page_"))
 async def handle_history_pagination(callback: types.CallbackQuery):
-    # Формат callback_data: history_page_{filter}_{page}
-    _, _, filter_type, page_str = callback.data.split("_")
-    page = int(page_str)
+    # Формат callback_data: history_page_{filter}_{page}_{n|p}_{created_at}_{id}
+    filter_type, page, direction, cursor = parse_page_callback(callback.data)
     await show_history_page(
         message=callback.message,
         user_id=callback.from_user.id,
         page=page,
         filter_type=filter_type,
-        edit=True
+        edit=True,
+        direction=direction,
+        cursor=cursor
     )
     await callback.answer()
@@ -49,7 +49,8 @@ async def menu_callback(callback: types.CallbackQuery):
             "/history - показывает историю транзакций"
         ],
         "delete": [
-            "/delete_transactions – Удалить транзакции"
+            "/delete_transactions – Удалить транзакции",
+            "/delete_range – Удалить операции за период"
         ],
         "help": [
             "/help – Справка по всем командам"
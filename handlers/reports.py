@@ -3,17 +3,14 @@ from aiogram.fsm.context import FSMContext
 from aiogram.filters import Command
 from datetime import datetime, date
 from states import Form
-from utils.database import fetchall
+from utils import db, report_queries, aggregation
 from keyboards import main_menu, cancel_button
-from typing import Tuple
-from collections import defaultdict
+from typing import BinaryIO, Tuple, Union
 
-import matplotlib.pyplot as plt
-import csv
-import os
 import asyncio
-from tempfile import NamedTemporaryFile
-from aiogram.types import FSInputFile
+from contextlib import aclosing
+from aiogram.types import BufferedInputFile
+from aiogram.exceptions import TelegramBadRequest
 from utils.formating import format_amount
 
 router = Router()
@@ -25,11 +22,6 @@ def validate_date(date_str: str) -> Tuple[bool, datetime]:
     except ValueError:
         return False, None
 
-async def delayed_file_removal(path: str, delay: int = 60):
-    await asyncio.sleep(delay)
-    if os.path.exists(path):
-        os.remove(path)
-
 @router.message(Command("report"))
 async def report_start(message: types.Message, state: FSMContext):
     await state.set_state(Form.REPORT_START_DATE)
@@ -43,7 +35,7 @@ async def monthly_report(message: types.Message):
     today = date.today()
     start_date = today.replace(day=1).strftime("%Y-%m-%d")
     end_date = today.strftime("%Y-%m-%d")
-    await generate_report(message, message.from_user.id, start_date, end_date)
+    await schedule_report(message, message.from_user.id, start_date, end_date)
 
 @router.message(Command("compare"))
 async def compare_months(message: types.Message):
@@ -57,8 +49,8 @@ async def compare_months(message: types.Message):
     previous_start = previous_month_start.strftime("%Y-%m-%d")
     previous_end = previous_month_end.strftime("%Y-%m-%d")
 
-    current = fetchall_summary(message.from_user.id, current_start, current_end)
-    previous = fetchall_summary(message.from_user.id, previous_start, previous_end)
+    current = await report_queries.summary_by_type(message.from_user.id, current_start, current_end)
+    previous = await report_queries.summary_by_type(message.from_user.id, previous_start, previous_end)
 
     if not current and not previous:
         return await message.answer("Нет данных за текущий и предыдущий месяцы.")
@@ -82,19 +74,6 @@ async def compare_months(message: types.Message):
 
 from datetime import timedelta
 
-def fetchall_summary(user_id: int, start: str, end: str) -> dict:
-    transactions = fetchall('''
-        SELECT t.amount, c.type
-        FROM transactions t
-        JOIN categories c ON t.category_id = c.id
-        WHERE t.user_id = ? AND date(t.created_at) BETWEEN ? AND ?
-    ''', (user_id, start, end))
-
-    summary = defaultdict(float)
-    for amount, type_ in transactions:
-        summary[type_] += amount
-    return summary
-
 @router.message(Form.REPORT_START_DATE)
 async def process_start_date(message: types.Message, state: FSMContext):
     if message.text == "❌ Отмена":
@@ -122,235 +101,198 @@ async def process_end_date(message: types.Message, state: FSMContext):
     data = await state.get_data()
     start_date = data['start_date']
     end_date = date_obj.strftime("%Y-%m-%d")
-    await generate_report(message, message.from_user.id, start_date, end_date)
+    # Состояние сбрасываем сразу: отчёт может подождать в очереди
     await state.clear()
+    await schedule_report(message, message.from_user.id, start_date, end_date)
 
 
-import os
-import csv
-import asyncio
-from datetime import datetime
-from collections import defaultdict
-from tempfile import NamedTemporaryFile
-from matplotlib import pyplot as plt
-from aiogram.types import FSInputFile
-
-from utils.database import fetchall
-from utils.formating import format_amount
-from utils.pdf_generator import create_pdf_report
-
-import matplotlib.pyplot as plt
-import os
-import asyncio
-from tempfile import NamedTemporaryFile
-from aiogram.types import FSInputFile
-from collections import defaultdict
-from utils.database import fetchall
-from utils.formating import format_amount
 from utils.pdf_generator import create_pdf_report
+from utils import charts
+from utils.report_queue import report_scheduler
+from utils.report_cache import ReportArtifacts, report_cache
+from utils import export
+from utils.config import REPORT_CSV_SPOOL_BYTES, REPORT_PDF_MAX_LINES
+from utils import logger
+
+# Фоновые задачи отчётов: ссылки держим, чтобы задачи не собрал GC
+_report_tasks = set()
+
+async def schedule_report(message, user_id: int, start_date: str, end_date: str):
+    """Постановка отчёта в очередь; повторный запрос того же отчёта не дублирует работу.
+
+    Отчёт строится в фоновой задаче: обработчик сразу освобождает очередь
+    обновлений пользователя, и бот отвечает на другие команды во время построения.
+    """
+    async def notify_queued(position: int):
+        await message.answer(f"⏳ Отчёт в очереди, позиция {position}")
+
+    async def run():
+        try:
+            accepted = await report_scheduler.submit(
+                user_id,
+                (user_id, start_date, end_date),
+                lambda: generate_report(message, user_id, start_date, end_date),
+                notify_queued
+            )
+            if not accepted:
+                await message.answer("⏳ Этот отчёт уже готовится, дождитесь его")
+        except Exception as e:
+            logger.error(f"Report {start_date}..{end_date} for user {user_id} failed: {e}")
+
+    task = asyncio.create_task(run())
+    _report_tasks.add(task)
+    task.add_done_callback(_report_tasks.discard)
+
+async def send_report_document(message, file_ids: dict, kind: str, data: Union[bytes, BinaryIO],
+                               filename: str, caption: str):
+    """Отправка документа отчёта; уже загруженный файл пересылается по file_id без повторной загрузки"""
+    file_id = file_ids.get(kind)
+    if file_id:
+        try:
+            await message.answer_document(file_id, caption=caption)
+            return
+        except TelegramBadRequest:
+            # file_id больше не принимается - загружаем заново
+            file_ids.pop(kind, None)
+    if isinstance(data, bytes):
+        document = BufferedInputFile(data, filename=filename)
+    else:
+        document = export.StreamInputFile(data, filename=filename)
+    sent = await message.answer_document(document, caption=caption)
+    if sent and sent.document:
+        file_ids[kind] = sent.document.file_id
+
+async def send_report(message, artifacts: ReportArtifacts, start_date: str, end_date: str):
+    """Отправка готового отчёта из кэша"""
+    for chunk in artifacts.text_chunks:
+        await message.answer(chunk)
+    await send_report_document(message, artifacts.file_ids, "csv", artifacts.csv,
+                               artifacts.csv_filename, "📁 CSV-отчет")
+    await send_report_document(message, artifacts.file_ids, "pdf", artifacts.pdf,
+                               f"report_{start_date}_{end_date}.pdf", "🧾 PDF-отчет")
 
 async def generate_report(message, user_id: int, start_date: str, end_date: str):
-    transactions = fetchall('''
-        SELECT 
+    # Версию читаем до выборки: запись во время построения даст отчёту устаревший ключ
+    version = (await db.fetchone("SELECT data_version FROM users WHERE user_id = ?", (user_id,)) or (0,))[0]
+    cache_key = (user_id, start_date, end_date, version)
+    cached = report_cache.get(cache_key)
+    if cached is not None:
+        return await send_report(message, cached, start_date, end_date)
+
+    # Суммы по дням и месяцам группирует SQLite; в Python приходят только итоговые строки
+    daily_rows, monthly_rows = await asyncio.gather(
+        report_queries.totals_by_day(user_id, start_date, end_date),
+        report_queries.totals_by_month(user_id, start_date, end_date),
+    )
+    if not daily_rows:
+        await message.answer("📉 За указанный период операций не найдено")
+        return
+
+    series = aggregation.from_totals(daily_rows, monthly_rows)
+    total_income, total_expense = series.total_income, series.total_expense
+    totals = [
+        "\nИтоги:",
+        f"{'Общий доход':<20}: {format_amount(total_income)} ₽",
+        f"{'Общий расход':<20}: {format_amount(total_expense)} ₽",
+        f"{'Баланс':<20}: {format_amount(total_income - total_expense)} ₽",
+    ]
+
+    # Операции читаются курсором и уходят сообщениями по 10 строк по мере чтения.
+    # Для PDF и кэша сохраняется не больше REPORT_PDF_MAX_LINES строк
+    pending = [f"Отчет с {start_date} по {end_date}:\n"]
+    pdf_lines = list(pending)
+    text_chunks = []
+    skipped = 0
+
+    async def emit(line: str):
+        nonlocal skipped
+        pending.append(line)
+        if len(pdf_lines) < REPORT_PDF_MAX_LINES:
+            pdf_lines.append(line)
+        else:
+            skipped += 1
+        if len(pending) == 10:
+            await flush()
+
+    async def flush():
+        chunk = "\n".join(pending)
+        pending.clear()
+        await message.answer(chunk)
+        if skipped:
+            text_chunks.clear()
+        else:
+            text_chunks.append(chunk)
+
+    current_date = None
+    rows = db.iterate('''
+        SELECT
             t.amount,
             c.name as category,
             c.type,
             t.description,
-            strftime('%d.%m.%Y', t.created_at) as date
+            strftime('%d.%m.%Y', t.day) as date
         FROM transactions t
         JOIN categories c ON t.category_id = c.id
-        WHERE 
+        WHERE
             t.user_id = ? AND
-            date(t.created_at) BETWEEN ? AND ?
-        ORDER BY t.created_at
+            t.day BETWEEN ? AND ?
+        ORDER BY t.day, t.id
     ''', (user_id, start_date, end_date))
-
-    if not transactions:
-        await message.answer("📉 За указанный период операций не найдено")
-        return
-
-    total_income = 0
-    total_expense = 0
-    report = [f"Отчет с {start_date} по {end_date}:\n"]
-
-    # Группируем транзакции по дате
-    grouped = defaultdict(list)
-
-    for amount, category, type_, description, date_str in transactions:
-        grouped[date_str].append((float(amount), category, type_, description))
-
-    # Строим отчет по дням
-    for date_str in sorted(grouped.keys(), key=lambda d: datetime.strptime(d, "%d.%m.%Y")):
-        report.append(f"\n {date_str}")
-        for amount, category, type_, description in grouped[date_str]:
-            type_label = "Доход" if type_ == "income" else "Расход"
-            report.append(f"  {type_label:<6} | {category:<30} | {format_amount(amount)} ₽")
-            if description:
-                report.append(f"     Описание: {description}")
-
-            if type_ == 'income':
-                total_income += amount
-            else:
-                total_expense += amount
-
-    # Итоги
-    report.append("\nИтоги:")
-    report.append(f"{'Общий доход':<20}: {format_amount(total_income)} ₽")
-    report.append(f"{'Общий расход':<20}: {format_amount(total_expense)} ₽")
-    report.append(f"{'Баланс':<20}: {format_amount(total_income - total_expense)} ₽")
-
-    # Отправка текстового отчёта по частям
-    for i in range(0, len(report), 10):
-        await message.answer("\n".join(report[i:i + 10]))
-
-    # CSV-файл
-    with NamedTemporaryFile(mode='w+', newline='', delete=False, suffix=".csv", encoding='utf-8-sig') as csvfile:
-        writer = csv.writer(csvfile)
-        writer.writerow(["Дата", "Тип", "Категория", "Сумма", "Описание"])
-        for amount, category, type_, description, date_str in transactions:
-            writer.writerow([
-                date_str,
-                "Доход" if type_ == "income" else "Расход",
-                category,
-                f"{amount:.2f}",
-                description or ""
-            ])
-        csv_path = csvfile.name
-
-    await message.answer_document(FSInputFile(csv_path), caption="📁 CSV-отчет")
-    asyncio.create_task(delayed_file_removal(csv_path))
-
-    image_paths = []
-
-
-    # 1. Сводная диаграмма
-    labels = ['Доходы', 'Расходы', 'Баланс']
-    values = [total_income, total_expense, total_income - total_expense]
-    colors = ['green', 'red', 'blue']
-    fig, ax = plt.subplots(figsize=(8, 6))
-    bars = ax.bar(labels, values, color=colors)
-    for bar in bars:
-        height = bar.get_height()
-        ax.text(bar.get_x() + bar.get_width() / 2, height + 50, f'{height:.2f}', ha='center')
-    ax.set_title('Сводная диаграмма')
-    plt.tight_layout()
-    path = f"summary_{user_id}.png"
-    plt.savefig(path)
-    plt.close(fig)
-    image_paths.append((path, "Доходы, расходы и баланс"))
-
-    # 2. Круговая диаграмма: Доходы и Расходы
-    labels_pie = ['Доходы', 'Расходы']
-    values_pie = [total_income, total_expense]
-    fig, ax = plt.subplots(figsize=(8, 6))
-    ax.pie(values_pie, labels=labels_pie, autopct='%1.1f%%', colors=['green', 'red'], startangle=90)
-    ax.axis('equal')  # Equal aspect ratio ensures that pie is drawn as a circle.
-    ax.set_title('Доходы и Расходы (круговая диаграмма)')
-    pie_chart_path = f"pie_chart_{user_id}.png"
-    plt.tight_layout()
-    plt.savefig(pie_chart_path)
-    plt.close(fig)
-    image_paths.append((pie_chart_path, "Доходы и Расходы"))
-
-    # 3. По месяцам
-    monthly_income = defaultdict(float)
-    monthly_expense = defaultdict(float)
-    for amount, _, type_, _, date_str in transactions:
-        dt = datetime.strptime(date_str, "%d.%m.%Y")
-        month = dt.strftime("%b %Y")
-        if type_ == 'income':
-            monthly_income[month] += amount
-        else:
-            monthly_expense[month] += amount
-
-    all_months = sorted(set(monthly_income.keys()) | set(monthly_expense.keys()), key=lambda m: datetime.strptime(m, "%b %Y"))
-    income_vals = [monthly_income[m] for m in all_months]
-    expense_vals = [monthly_expense[m] for m in all_months]
-
-    fig, ax = plt.subplots(figsize=(12, 6))
-    x = range(len(all_months))
-    ax.bar([i - 0.2 for i in x], income_vals, width=0.4, label='Доходы', color='green')
-    ax.bar([i + 0.2 for i in x], expense_vals, width=0.4, label='Расходы', color='red')
-    ax.set_xticks(x)
-    ax.set_xticklabels(all_months, rotation=45)
-    ax.set_title("Доходы и расходы по месяцам")
-    ax.legend()
-    plt.tight_layout()
-    path = f"monthly_{user_id}.png"
-    plt.savefig(path)
-    plt.close(fig)
-    image_paths.append((path, "По месяцам"))
-
-    # 4. Накопительный баланс по месяцам
-    running_total = 0
-    cumulative = []
-    for m in all_months:
-        running_total += monthly_income.get(m, 0) - monthly_expense.get(m, 0)
-        cumulative.append(running_total)
-
-    fig, ax = plt.subplots(figsize=(12, 6))
-    ax.plot(all_months, cumulative, marker='o', color='blue')
-    ax.set_title("Накопительный баланс по месяцам")
-    ax.axhline(0, color='gray', linestyle='--')
-    plt.xticks(rotation=45)
-    plt.tight_layout()
-    path = f"cumulative_{user_id}.png"
-    plt.savefig(path)
-    plt.close(fig)
-    image_paths.append((path, "Баланс по месяцам"))
-
-    # 5. По дням
-    daily_data = defaultdict(lambda: {'income': 0, 'expense': 0})
-    for amount, _, type_, _, date_str in transactions:
-        if type_ == 'income':
-            daily_data[date_str]['income'] += amount
-        else:
-            daily_data[date_str]['expense'] += amount
-
-    sorted_days = sorted(daily_data.keys(), key=lambda d: datetime.strptime(d, "%d.%m.%Y"))
-    incomes = [daily_data[d]['income'] for d in sorted_days]
-    expenses = [daily_data[d]['expense'] for d in sorted_days]
-    balance = [i - e for i, e in zip(incomes, expenses)]
-
-    fig, ax = plt.subplots(figsize=(14, 6))
-    ax.plot(sorted_days, incomes, label='Доходы', color='green', marker='o')
-    ax.plot(sorted_days, expenses, label='Расходы', color='red', marker='o')
-    ax.plot(sorted_days, balance, label='Баланс (день)', color='blue', linestyle='--', marker='x')
-    ax.set_title("Дневная динамика")
-    ax.legend()
-    plt.xticks(rotation=45)
-    plt.tight_layout()
-    path = f"timeline_{user_id}.png"
-    plt.savefig(path)
-    plt.close(fig)
-    image_paths.append((path, "Динамика по дням"))
-
-    # 6. Накопительный по дням
-    cumulative_daily = []
-    running_total = 0
-    net_by_day = {d: daily_data[d]['income'] - daily_data[d]['expense'] for d in sorted_days}
-    for d in sorted_days:
-        running_total += net_by_day[d]
-        cumulative_daily.append(running_total)
-
-    fig, ax = plt.subplots(figsize=(14, 6))
-    ax.fill_between(sorted_days, cumulative_daily, step='pre', color='dodgerblue', alpha=0.4)
-    ax.plot(sorted_days, cumulative_daily, marker='o', color='blue')
-    ax.axhline(0, color='gray', linestyle='--')
-    ax.set_title("Накопительный баланс по дням")
-    plt.xticks(rotation=45)
-    plt.tight_layout()
-    path = f"cumulative_daily_{user_id}.png"
-    plt.savefig(path)
-    plt.close(fig)
-    image_paths.append((path, "Баланс по дням (накопительный)"))
+    async with aclosing(rows):
+        async for batch in rows:
+            for amount, category, type_, description, date_str in batch:
+                # Выборка отсортирована по дню: заголовок дня - при его смене
+                if date_str != current_date:
+                    current_date = date_str
+                    await emit(f"\n {date_str}")
+                type_label = "Доход" if type_ == "income" else "Расход"
+                await emit(f"  {type_label:<6} | {category:<30} | {format_amount(float(amount))} ₽")
+                if description:
+                    await emit(f"     Описание: {description}")
+
+    for line in totals:
+        await emit(line)
+    if pending:
+        await flush()
+    if skipped:
+        pdf_lines.append(f"\n... и ещё {skipped} строк: полный список в сообщениях и CSV")
+        pdf_lines.extend(totals)
+
+    # CSV пишется потоково во временный файл, в памяти не собирается
+    csv_file, csv_extension = await export.export_transactions_csv(user_id, start_date, end_date)
+    csv_filename = f"report_{start_date}_{end_date}{csv_extension}"
+    file_ids = {}
+    with csv_file:
+        # Небольшую выгрузку сохраняем для кэша отчёта, большую - нет
+        csv_size = csv_file.tell()
+        csv_data = None
+        if csv_size <= REPORT_CSV_SPOOL_BYTES:
+            csv_file.seek(0)
+            csv_data = csv_file.read()
+        await send_report_document(message, file_ids, "csv", csv_data or csv_file, csv_filename, "📁 CSV-отчет")
+
+    # Все шесть графиков рисуются параллельно в пуле процессов
+    chart_jobs = [
+        (charts.render_summary, (total_income, total_expense), "Доходы, расходы и баланс"),
+        (charts.render_pie, (total_income, total_expense), "Доходы и Расходы"),
+        (charts.render_monthly, (series.month_labels, series.monthly_income, series.monthly_expense),
+         "По месяцам"),
+        (charts.render_cumulative, (series.month_labels, series.cumulative_monthly), "Баланс по месяцам"),
+        (charts.render_timeline, (series.day_labels, series.daily_income, series.daily_expense),
+         "Динамика по дням"),
+        (charts.render_cumulative_daily, (series.day_labels, series.cumulative_daily),
+         "Баланс по дням (накопительный)"),
+    ]
+    images = await asyncio.gather(*(charts.run(func, *args) for func, args, _ in chart_jobs))
+    image_captions = [(png, caption) for png, (_, _, caption) in zip(images, chart_jobs)]
 
     # PDF
-    summary_text = "\n".join(report)
-    pdf_path = create_pdf_report(user_id, summary_text, image_paths)
-    await message.answer_document(FSInputFile(pdf_path), caption="🧾 PDF-отчет")
-    asyncio.create_task(delayed_file_removal(pdf_path))
-
-    # Очистка изображений
-    for path, _ in image_paths:
-        asyncio.create_task(delayed_file_removal(path))
+    summary_text = "\n".join(pdf_lines)
+    pdf_data = await charts.run(create_pdf_report, summary_text, image_captions)
+    await send_report_document(message, file_ids, "pdf", pdf_data,
+                               f"report_{start_date}_{end_date}.pdf", "🧾 PDF-отчет")
+
+    # Кэшируется только отчёт, поместившийся целиком: иначе текст пришлось бы держать в памяти
+    if csv_data is not None and not skipped:
+        report_cache.put(cache_key, ReportArtifacts(text_chunks, csv_data, image_captions, pdf_data,
+                                                    file_ids, csv_filename))
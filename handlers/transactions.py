@@ -4,7 +4,7 @@ from aiogram.filters import Command
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.types import CallbackQuery
 from states import Form
-from utils.database import execute, fetchone, fetchall
+from utils import db, ledger, category_cache
 from keyboards import main_menu, cancel_button, dynamic_list_keyboard, skip_button
 from utils.formating import format_amount
 from datetime import datetime
@@ -27,12 +27,12 @@ async def process_income_amount(message: types.Message, state: FSMContext):
         amount = float(message.text.replace(' ', '').replace(',', '.'))
         if amount <= 0:
             raise ValueError
-        categories = fetchall("SELECT name FROM categories WHERE user_id = ? AND type = 'income'", (message.from_user.id,))
+        categories = await category_cache.get_names(message.from_user.id, 'income')
         if not categories:
             await state.clear()
             return await message.answer("❌ Нет категорий доходов! Создайте через /addcategory")
         await state.update_data(amount=amount)
-        await message.answer("📋 Выберите категорию:", reply_markup=dynamic_list_keyboard([name for (name,) in categories]))
+        await message.answer("📋 Выберите категорию:", reply_markup=dynamic_list_keyboard(categories))
         await state.set_state(Form.ADD_INCOME_CATEGORY)
     except ValueError:
         await message.answer("❌ Введите корректную сумму!")
@@ -42,12 +42,11 @@ async def process_income_category(message: types.Message, state: FSMContext):
     if message.text == "❌ Отмена":
         await state.clear()
         return await message.answer("Отменено", reply_markup=main_menu())
-    category = fetchone("SELECT id FROM categories WHERE user_id = ? AND name = ? AND type = 'income'", (message.from_user.id, message.text))
-    if not category:
-        execute("INSERT INTO categories (user_id, name, type) VALUES (?, ?, 'income')", (message.from_user.id, message.text))
-        category = fetchone("SELECT id FROM categories WHERE user_id = ? AND name = ? AND type = 'income'", (message.from_user.id, message.text))
-        await message.answer(f"📁 Категория '{message.text}' создана как доход.")
-    await state.update_data(category_id=category[0], category_name=message.text)
+    # Новая категория создаётся вместе с транзакцией, в одном коммите
+    category_id = await category_cache.get_id(message.from_user.id, message.text, 'income')
+    if category_id is None:
+        await message.answer(f"📁 Категория '{message.text}' будет создана как доход.")
+    await state.update_data(category_id=category_id, category_name=message.text)
     await state.set_state(Form.ADD_INCOME_DATE)
     await message.answer("📅 Введите дату дохода в формате ДД.ММ.ГГГГ или отправьте «⏭ Пропустить» для сегодняшней даты:", reply_markup=skip_button())
 
@@ -70,13 +69,15 @@ async def process_income_description(message: types.Message, state: FSMContext):
     description = message.text if message.text != "⏭ Пропустить" else None
     date = data.get('date', datetime.now().date().isoformat())
     try:
-        execute(
-            """INSERT INTO transactions (user_id, amount, category_id, description, created_at)
-               VALUES (?, ?, ?, ?, ?)""",
-            (message.from_user.id, data['amount'], data['category_id'], description, date)
-        )
-        execute("UPDATE users SET balance = balance + ? WHERE user_id = ?", (data['amount'], message.from_user.id))
-        new_balance = fetchone("SELECT balance FROM users WHERE user_id = ?", (message.from_user.id,))[0]
+        known = {data['category_name']: data['category_id']} if data.get('category_id') else {}
+
+        def save(cur):
+            category_id = ledger.resolve_categories(cur, message.from_user.id, [data['category_name']],
+                                                    'income', known)[data['category_name']]
+            return ledger.add_transaction(cur, message.from_user.id, data['amount'], category_id,
+                                          'income', description, date)
+
+        new_balance = await db.transaction(save)
         response = (f"✅ Доход добавлен!\n"
                     f"💵 Сумма: {format_amount(float(data['amount']))} ₽\n"
                     f"📂 Категория: {data['category_name']}\n"
@@ -107,12 +108,12 @@ async def process_expense_amount(message: types.Message, state: FSMContext):
         amount = float(message.text.replace(' ', '').replace(',', '.'))
         if amount <= 0:
             raise ValueError
-        categories = fetchall("SELECT name FROM categories WHERE user_id = ? AND type = 'expense'", (message.from_user.id,))
+        categories = await category_cache.get_names(message.from_user.id, 'expense')
         if not categories:
             await state.clear()
             return await message.answer("❌ Нет категорий расходов! Создайте через /addcategory")
         await state.update_data(amount=amount)
-        await message.answer("📋 Выберите категорию:", reply_markup=dynamic_list_keyboard([name for (name,) in categories]))
+        await message.answer("📋 Выберите категорию:", reply_markup=dynamic_list_keyboard(categories))
         await state.set_state(Form.ADD_EXPENSE_CATEGORY)
     except ValueError:
         await message.answer("❌ Введите корректную сумму!")
@@ -122,12 +123,11 @@ async def process_expense_category(message: types.Message, state: FSMContext):
     if message.text == "❌ Отмена":
         await state.clear()
         return await message.answer("Отменено", reply_markup=main_menu())
-    category = fetchone("SELECT id FROM categories WHERE user_id = ? AND name = ? AND type = 'expense'", (message.from_user.id, message.text))
-    if not category:
-        execute("INSERT INTO categories (user_id, name, type) VALUES (?, ?, 'expense')", (message.from_user.id, message.text))
-        category = fetchone("SELECT id FROM categories WHERE user_id = ? AND name = ? AND type = 'expense'", (message.from_user.id, message.text))
-        await message.answer(f"📁 Категория '{message.text}' создана как расход.")
-    await state.update_data(category_id=category[0], category_name=message.text)
+    # Новая категория создаётся вместе с транзакцией, в одном коммите
+    category_id = await category_cache.get_id(message.from_user.id, message.text, 'expense')
+    if category_id is None:
+        await message.answer(f"📁 Категория '{message.text}' будет создана как расход.")
+    await state.update_data(category_id=category_id, category_name=message.text)
     await state.set_state(Form.ADD_EXPENSE_DATE)
     await message.answer("📅 Введите дату расхода в формате ДД.ММ.ГГГГ или отправьте «⏭ Пропустить» для сегодняшней даты:", reply_markup=skip_button())
 
@@ -150,13 +150,15 @@ async def process_expense_description(message: types.Message, state: FSMContext)
     description = message.text if message.text != "⏭ Пропустить" else None
     date = data.get('date', datetime.now().date().isoformat())
     try:
-        execute(
-            """INSERT INTO transactions (user_id, amount, category_id, description, created_at)
-               VALUES (?, ?, ?, ?, ?)""",
-            (message.from_user.id, data['amount'], data['category_id'], description, date)
-        )
-        execute("UPDATE users SET balance = balance - ? WHERE user_id = ?", (data['amount'], message.from_user.id))
-        new_balance = fetchone("SELECT balance FROM users WHERE user_id = ?", (message.from_user.id,))[0]
+        known = {data['category_name']: data['category_id']} if data.get('category_id') else {}
+
+        def save(cur):
+            category_id = ledger.resolve_categories(cur, message.from_user.id, [data['category_name']],
+                                                    'expense', known)[data['category_name']]
+            return ledger.add_transaction(cur, message.from_user.id, data['amount'], category_id,
+                                          'expense', description, date)
+
+        new_balance = await db.transaction(save)
         response = (f"✅ Расход добавлен!\n"
                     f"💸 Сумма: {format_amount(float(data['amount']))} ₽\n"
                     f"📂 Категория: {data['category_name']}\n"
@@ -170,6 +172,34 @@ async def process_expense_description(message: types.Message, state: FSMContext)
     finally:
         await state.clear()
 
+# =================== МАССОВОЕ ДОБАВЛЕНИЕ ===================
+
+def parse_transaction_list(lines: list) -> tuple:
+    """Разбор строк «Категория - Сумма - Описание»: (записи, ошибки по строкам)"""
+    items = []
+    errors = []
+    for i, line in enumerate(lines, 1):
+        try:
+            parts = [p.strip() for p in line.split('-', 2)]
+            if len(parts) < 2:
+                raise ValueError("Недостаточно данных")
+            category, amount_str = parts[0], parts[1]
+            description = parts[2] if len(parts) > 2 else None
+            amount = float(amount_str.replace(',', '.'))
+            items.append((category, amount, description))
+        except Exception as e:
+            errors.append(f"Строка {i}: {str(e)}")
+    return items, errors
+
+async def save_transaction_list(user_id: int, type_: str, date_str: str, lines: list) -> tuple:
+    """Разбор всех строк, затем запись корректных одной пачкой в одной транзакции БД"""
+    items, errors = parse_transaction_list(lines)
+    if not items:
+        return 0, errors
+    known_ids = await category_cache.lookup(user_id, (name for name, _, _ in items), type_)
+    successes = await db.transaction(ledger.add_transactions, user_id, type_, items, date_str, known_ids)
+    return successes, errors
+
 # =================== МАССОВОЕ ДОБАВЛЕНИЕ ДОХОДОВ ===================
 
 @router.message(Command("add_income_list"))
@@ -213,30 +243,17 @@ async def process_income_list(message: types.Message, state: FSMContext):
     data = await state.get_data()
     date_str = data.get("date", datetime.now().date().isoformat())
     lines = message.text.strip().split('\n')
-    successes = 0
-    errors = []
-    for i, line in enumerate(lines, 1):
-        try:
-            parts = [p.strip() for p in line.split('-', 2)]
-            if len(parts) < 2:
-                raise ValueError("Недостаточно данных")
-            category, amount_str = parts[0], parts[1]
-            description = parts[2] if len(parts) > 2 else None
-            amount = float(amount_str.replace(',', '.'))
-            category_id = fetchone("SELECT id FROM categories WHERE user_id = ? AND name = ? AND type = 'income'", (user_id, category))
-            if not category_id:
-                execute("INSERT INTO categories (user_id, name, type) VALUES (?, ?, 'income')", (user_id, category))
-                category_id = fetchone("SELECT id FROM categories WHERE user_id = ? AND name = ? AND type = 'income'", (user_id, category))
-            execute("INSERT INTO transactions (user_id, amount, category_id, description, created_at) VALUES (?, ?, ?, ?, ?)", (user_id, amount, category_id[0], description, date_str))
-            execute("UPDATE users SET balance = balance + ? WHERE user_id = ?", (amount, user_id))
-            successes += 1
-        except Exception as e:
-            errors.append(f"Строка {i}: {str(e)}")
-    result = f"✅ Добавлено доходов: {successes}\n"
-    if errors:
-        result += "❌ Ошибки:\n" + "\n".join(errors)
-    await message.answer(result, reply_markup=main_menu())
-    await state.clear()
+    try:
+        successes, errors = await save_transaction_list(user_id, 'income', date_str, lines)
+        result = f"✅ Добавлено доходов: {successes}\n"
+        if errors:
+            result += "❌ Ошибки:\n" + "\n".join(errors)
+        await message.answer(result, reply_markup=main_menu())
+    except Exception as e:
+        # Список пишется одной транзакцией: при ошибке не добавлено ничего
+        await message.answer(f"❌ Ошибка, доходы не добавлены: {str(e)}", reply_markup=main_menu())
+    finally:
+        await state.clear()
 
 # =================== МАССОВОЕ ДОБАВЛЕНИЕ РАСХОДОВ ===================
 
@@ -281,108 +298,200 @@ async def process_expense_list(message: types.Message, state: FSMContext):
     data = await state.get_data()
     date_str = data.get("date", datetime.now().date().isoformat())
     lines = message.text.strip().split('\n')
-    successes = 0
-    errors = []
-    for i, line in enumerate(lines, 1):
-        try:
-            parts = [p.strip() for p in line.split('-', 2)]
-            if len(parts) < 2:
-                raise ValueError("Недостаточно данных")
-            category, amount_str = parts[0], parts[1]
-            description = parts[2] if len(parts) > 2 else None
-            amount = float(amount_str.replace(',', '.'))
-            category_id = fetchone("SELECT id FROM categories WHERE user_id = ? AND name = ? AND type = 'expense'", (user_id, category))
-            if not category_id:
-                execute("INSERT INTO categories (user_id, name, type) VALUES (?, ?, 'expense')", (user_id, category))
-                category_id = fetchone("SELECT id FROM categories WHERE user_id = ? AND name = ? AND type = 'expense'", (user_id, category))
-            execute("INSERT INTO transactions (user_id, amount, category_id, description, created_at) VALUES (?, ?, ?, ?, ?)", (user_id, amount, category_id[0], description, date_str))
-            execute("UPDATE users SET balance = balance - ? WHERE user_id = ?", (amount, user_id))
-            successes += 1
-        except Exception as e:
-            errors.append(f"Строка {i}: {str(e)}")
-    result = f"✅ Добавлено расходов: {successes}\n"
-    if errors:
-        result += "❌ Ошибки:\n" + "\n".join(errors)
-    await message.answer(result, reply_markup=main_menu())
-    await state.clear()
+    try:
+        successes, errors = await save_transaction_list(user_id, 'expense', date_str, lines)
+        result = f"✅ Добавлено расходов: {successes}\n"
+        if errors:
+            result += "❌ Ошибки:\n" + "\n".join(errors)
+        await message.answer(result, reply_markup=main_menu())
+    except Exception as e:
+        # Список пишется одной транзакцией: при ошибке не добавлено ничего
+        await message.answer(f"❌ Ошибка, расходы не добавлены: {str(e)}", reply_markup=main_menu())
+    finally:
+        await state.clear()
 
 
 # ==================== Удаление транзакций с выбором ====================
-@router.message(Command("delete_transactions"))
-async def start_delete_transactions(message: types.Message, state: FSMContext):
-    transactions = fetchall(
+DELETE_PAGE_SIZE = 10
+
+async def build_delete_keyboard(user_id: int, page: int, selected: set):
+    """Страница выбора транзакций для удаления; None - транзакций нет"""
+    total = (await db.fetchone(
+        "SELECT COALESCE(SUM(count), 0) FROM transaction_counts WHERE user_id = ?", (user_id,)
+    ))[0]
+    if not total:
+        return None
+    total_pages = (total + DELETE_PAGE_SIZE - 1) // DELETE_PAGE_SIZE
+    page = min(max(page, 1), total_pages)
+
+    transactions = await db.fetchall(
         '''
         SELECT t.id, t.amount, c.name, c.type, t.description, strftime('%d.%m.%Y', t.created_at)
         FROM transactions t
         JOIN categories c ON t.category_id = c.id
         WHERE t.user_id = ?
-        ORDER BY t.created_at DESC
-        LIMIT 10
+        ORDER BY t.created_at DESC, t.id DESC
+        LIMIT ? OFFSET ?
         ''',
-        (message.from_user.id,)
+        (user_id, DELETE_PAGE_SIZE, (page - 1) * DELETE_PAGE_SIZE)
     )
 
-    if not transactions:
-        return await message.answer("❌ Нет транзакций для удаления.")
-
     keyboard = InlineKeyboardMarkup(inline_keyboard=[])
-    tx_map = {}
-
-    for i, (tx_id, amount, category, type_, desc, date) in enumerate(transactions, 1):
+    for i, (tx_id, amount, category, type_, desc, date) in enumerate(transactions, (page - 1) * DELETE_PAGE_SIZE + 1):
         icon = "💵" if type_ == "income" else "💸"
-        text = f"{i}. {date} | {icon} {category} - {amount} ₽"
+        mark = "✅ " if tx_id in selected else ""
+        text = f"{mark}{i}. {date} | {icon} {category} - {amount} ₽"
         if desc:
             text += f" | 📝 {desc}"
-        callback_data = f"toggle:{tx_id}"
-        keyboard.inline_keyboard.append([InlineKeyboardButton(text=text, callback_data=callback_data)])
-        tx_map[str(tx_id)] = False
+        keyboard.inline_keyboard.append([InlineKeyboardButton(text=text, callback_data=f"toggle:{tx_id}")])
+
+    # Навигация и выбор всей страницы
+    nav = []
+    if page > 1:
+        nav.append(InlineKeyboardButton(text="◀️", callback_data=f"del_page:{page - 1}"))
+    nav.append(InlineKeyboardButton(text="☑️ Вся страница", callback_data=f"del_page_all:{page}"))
+    if page < total_pages:
+        nav.append(InlineKeyboardButton(text="▶️", callback_data=f"del_page:{page + 1}"))
+    keyboard.inline_keyboard.append(nav)
 
     # Кнопка подтверждения
     keyboard.inline_keyboard.append([
-        InlineKeyboardButton(text="✅ Удалить выбранные", callback_data="confirm_delete")
+        InlineKeyboardButton(text=f"✅ Удалить выбранные ({len(selected)})", callback_data="confirm_delete")
     ])
+    return keyboard, page, [tx[0] for tx in transactions]
+
+@router.message(Command("delete_transactions"))
+async def start_delete_transactions(message: types.Message, state: FSMContext):
+    result = await build_delete_keyboard(message.from_user.id, 1, set())
+    if result is None:
+        return await message.answer("❌ Нет транзакций для удаления.")
+    keyboard, page, _ = result
 
     await state.set_state(Form.DELETE_MULTI_TRANSACTIONS)
-    await state.update_data(tx_choices=tx_map)
+    await state.set_data({"selected": [], "page": page})
     await message.answer("🗑 Выберите транзакции для удаления:", reply_markup=keyboard)
 
+async def refresh_delete_page(callback: CallbackQuery, state: FSMContext, page: int, selected: set):
+    result = await build_delete_keyboard(callback.from_user.id, page, selected)
+    if result is None:
+        await state.clear()
+        return await callback.message.edit_text("❌ Нет транзакций для удаления.", reply_markup=None)
+    keyboard, page, _ = result
+    await state.update_data(selected=sorted(selected), page=page)
+    await callback.message.edit_reply_markup(reply_markup=keyboard)
+
 @router.callback_query(Form.DELETE_MULTI_TRANSACTIONS, lambda c: c.data.startswith("toggle:"))
 async def toggle_transaction_selection(callback: CallbackQuery, state: FSMContext):
-    tx_id = callback.data.split(":")[1]
+    tx_id = int(callback.data.split(":")[1])
+    data = await state.get_data()
+    selected = set(data.get("selected", []))
+    selected ^= {tx_id}
+    await refresh_delete_page(callback, state, data.get("page", 1), selected)
+    await callback.answer("Выбор обновлен")
+
+@router.callback_query(Form.DELETE_MULTI_TRANSACTIONS, lambda c: c.data.startswith("del_page:"))
+async def change_delete_page(callback: CallbackQuery, state: FSMContext):
+    page = int(callback.data.split(":")[1])
     data = await state.get_data()
-    tx_choices = data.get("tx_choices", {})
+    await refresh_delete_page(callback, state, page, set(data.get("selected", [])))
+    await callback.answer()
 
-    if tx_id in tx_choices:
-        tx_choices[tx_id] = not tx_choices[tx_id]
-        await state.update_data(tx_choices=tx_choices)
-        await callback.answer("Выбор обновлен")
-    else:
-        await callback.answer("Транзакция не найдена", show_alert=True)
+@router.callback_query(Form.DELETE_MULTI_TRANSACTIONS, lambda c: c.data.startswith("del_page_all:"))
+async def toggle_delete_page(callback: CallbackQuery, state: FSMContext):
+    page = int(callback.data.split(":")[1])
+    data = await state.get_data()
+    selected = set(data.get("selected", []))
+    result = await build_delete_keyboard(callback.from_user.id, page, selected)
+    if result is not None:
+        # Если вся страница уже выбрана - снимаем выбор, иначе выбираем всё
+        page_ids = set(result[2])
+        selected = selected - page_ids if page_ids <= selected else selected | page_ids
+    await refresh_delete_page(callback, state, page, selected)
+    await callback.answer("Выбор обновлен")
 
 @router.callback_query(Form.DELETE_MULTI_TRANSACTIONS, lambda c: c.data == "confirm_delete")
 async def confirm_delete_multiple(callback: CallbackQuery, state: FSMContext):
     data = await state.get_data()
-    tx_choices = data.get("tx_choices", {})
-    selected_ids = [int(tx_id) for tx_id, selected in tx_choices.items() if selected]
+    selected_ids = data.get("selected", [])
 
     if not selected_ids:
         await callback.message.edit_text("❌ Ничего не выбрано", reply_markup=None)
         return
 
-    deleted = 0
-    for tx_id in selected_ids:
-        tx = fetchone(
-            "SELECT amount, c.type FROM transactions t JOIN categories c ON t.category_id = c.id WHERE t.id = ?",
-            (tx_id,)
-        )
-        if not tx:
-            continue
-        amount, type_ = tx
-        sign = 1 if type_ == "income" else -1
-
-        execute("DELETE FROM transactions WHERE id = ?", (tx_id,))
-        execute("UPDATE users SET balance = balance - ? WHERE user_id = ?", (amount * sign, callback.from_user.id))
-        deleted += 1
+    deleted = await db.transaction(ledger.delete_transactions, callback.from_user.id, selected_ids)
+
+    await callback.message.edit_text(f"✅ Удалено транзакций: {deleted}", reply_markup=None)
+    await state.clear()
+
+# ==================== Удаление транзакций за период ====================
+@router.message(Command("delete_range"))
+async def start_delete_range(message: types.Message, state: FSMContext):
+    await state.set_state(Form.DELETE_RANGE_START)
+    await message.answer("📅 Введите начальную дату в формате ДД.ММ.ГГГГ", reply_markup=cancel_button())
+
+@router.message(Form.DELETE_RANGE_START)
+async def process_delete_range_start(message: types.Message, state: FSMContext):
+    if message.text == "❌ Отмена":
+        await state.clear()
+        return await message.answer("Отменено", reply_markup=main_menu())
+    try:
+        start = datetime.strptime(message.text, "%d.%m.%Y").date()
+    except ValueError:
+        return await message.answer("❌ Неверный формат даты! Используйте ДД.ММ.ГГГГ")
+    await state.update_data(start=start.isoformat())
+    await state.set_state(Form.DELETE_RANGE_END)
+    await message.answer("📅 Введите конечную дату:", reply_markup=cancel_button())
+
+@router.message(Form.DELETE_RANGE_END)
+async def process_delete_range_end(message: types.Message, state: FSMContext):
+    if message.text == "❌ Отмена":
+        await state.clear()
+        return await message.answer("Отменено", reply_markup=main_menu())
+    try:
+        end = datetime.strptime(message.text, "%d.%m.%Y").date()
+    except ValueError:
+        return await message.answer("❌ Неверный формат даты! Используйте ДД.ММ.ГГГГ")
+    start = (await state.get_data())["start"]
+    if end.isoformat() < start:
+        return await message.answer("❌ Конечная дата раньше начальной!")
+
+    # Что будет удалено - по сводной таблице, без чтения самих транзакций
+    count, income, expense = await db.fetchone(
+        '''
+        SELECT COALESCE(SUM(d.count), 0), COALESCE(SUM(d.income), 0), COALESCE(SUM(d.expense), 0)
+        FROM daily_totals d
+        JOIN categories c ON d.category_id = c.id
+        WHERE d.user_id = ? AND d.day BETWEEN ? AND ?
+        ''',
+        (message.from_user.id, start, end.isoformat())
+    )
+    if not count:
+        await state.clear()
+        return await message.answer("📉 За указанный период операций не найдено", reply_markup=main_menu())
+
+    await state.update_data(end=end.isoformat())
+    await state.set_state(Form.DELETE_RANGE_CONFIRM)
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[[
+        InlineKeyboardButton(text="🗑 Удалить", callback_data="range_delete:yes"),
+        InlineKeyboardButton(text="❌ Отмена", callback_data="range_delete:no")
+    ]])
+    await message.answer(
+        f"Будет удалено операций: {count}\n"
+        f"💰 Доходы: {format_amount(income)} ₽\n"
+        f"📉 Расходы: {format_amount(expense)} ₽\n"
+        "Подтвердить?",
+        reply_markup=keyboard
+    )
+
+@router.callback_query(Form.DELETE_RANGE_CONFIRM, lambda c: c.data.startswith("range_delete:"))
+async def confirm_delete_range(callback: CallbackQuery, state: FSMContext):
+    data = await state.get_data()
+    await state.clear()
+    if callback.data != "range_delete:yes":
+        await callback.message.edit_text("Отменено", reply_markup=None)
+        return await callback.answer()
 
+    deleted = await db.transaction(ledger.delete_transactions_in_range, callback.from_user.id,
+                                   data["start"], data["end"])
     await callback.message.edit_text(f"✅ Удалено транзакций: {deleted}", reply_markup=None)
-    await state.clear()
\ No newline at end of file
+    await callback.answer()
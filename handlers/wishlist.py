@@ -2,7 +2,7 @@ from aiogram import Router, types, F
 from aiogram.fsm.context import FSMContext
 from states import Form
 from aiogram.filters import Command  # <-- Добавьте этот импорт
-from utils.database import execute, fetchone, fetchall
+from utils import db, ledger, category_cache
 from keyboards import (
     main_menu,
     cancel_button,
@@ -11,6 +11,7 @@ from keyboards import (
 )
 from typing import List, Tuple
 from utils.formating import format_amount
+from utils.balance_cache import get_balance
 
 
 router = Router()
@@ -55,7 +56,7 @@ async def process_wish_amount(message: types.Message, state: FSMContext):
             raise ValueError
         
         data = await state.get_data()
-        execute('''INSERT INTO wishes (user_id, title, description, target_amount)
+        await db.execute('''INSERT INTO wishes (user_id, title, description, target_amount)
                  VALUES (?, ?, ?, ?)''',
                (message.from_user.id, data['title'], data['description'], amount))
         
@@ -67,13 +68,13 @@ async def process_wish_amount(message: types.Message, state: FSMContext):
 # ------------------- Просмотр вишлиста -------------------
 async def get_wishlist_page(user_id: int, page: int) -> Tuple[List[Tuple], int]:
     offset = (page - 1) * ITEMS_PER_PAGE
-    wishes = fetchall('''SELECT title, target_amount FROM wishes 
+    wishes = await db.fetchall('''SELECT title, target_amount FROM wishes 
                       WHERE user_id = ? 
                       ORDER BY target_amount ASC
                       LIMIT ? OFFSET ?''',
                    (user_id, ITEMS_PER_PAGE, offset))
     
-    total = fetchone("SELECT COUNT(*) FROM wishes WHERE user_id = ?", (user_id,))[0]
+    total = (await db.fetchone("SELECT COUNT(*) FROM wishes WHERE user_id = ?", (user_id,)))[0]
     total_pages = (total + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE
     return wishes, total_pages
 
@@ -91,7 +92,7 @@ async def show_wishlist_page(
     message: types.Message, 
     edit: bool = False
 ):
-    balance = fetchone("SELECT balance FROM users WHERE user_id = ?", (user_id,))[0]
+    balance = await get_balance(user_id)
     wishes, total_pages = await get_wishlist_page(user_id, page)
     
     if not wishes:
@@ -100,13 +101,13 @@ async def show_wishlist_page(
     text = f"📋 Список желаний (Страница {page}/{total_pages}):\n\n"
 
     if page == 1:
-        total_target = fetchone(
+        total_target = (await db.fetchone(
             "SELECT SUM(target_amount) FROM wishes WHERE user_id = ?",
             (user_id,)
-        )[0] or 0
+        ))[0] or 0
 
         # Получим все суммы целей
-        all_targets = fetchall(
+        all_targets = await db.fetchall(
             "SELECT target_amount FROM wishes WHERE user_id = ? ORDER BY target_amount ASC",
             (user_id,)
         )
@@ -166,7 +167,7 @@ async def pagination_handler(callback: types.CallbackQuery):
 # ------------------- Удаление желаний -------------------
 @router.message(Command("delete_wish"))
 async def delete_wish_start(message: types.Message, state: FSMContext):
-    wishes = fetchall('''SELECT title FROM wishes 
+    wishes = await db.fetchall('''SELECT title FROM wishes 
                        WHERE user_id = ?''',
                     (message.from_user.id,))
     
@@ -185,12 +186,12 @@ async def process_delete_wish(message: types.Message, state: FSMContext):
         await state.clear()
         return await message.answer("Отменено", reply_markup=main_menu())
     
-    wish = fetchone('''SELECT id FROM wishes 
+    wish = await db.fetchone('''SELECT id FROM wishes 
                      WHERE user_id = ? AND title = ?''',
                   (message.from_user.id, message.text))
     
     if wish:
-        execute("DELETE FROM wishes WHERE id = ?", (wish[0],))
+        await db.execute("DELETE FROM wishes WHERE id = ?", (wish[0],))
         await message.answer(f"✅ Желание '{message.text}' удалено!", reply_markup=main_menu())
     else:
         await message.answer("❌ Желание не найдено!")
@@ -212,34 +213,65 @@ async def add_wishes_start(message: types.Message, state: FSMContext):
         reply_markup=cancel_button()
     )
 
-@router.message(Form.ADD_WISHES_LIST)
-async def process_wishes_list(message: types.Message, state: FSMContext):
-    if message.text == "❌ Отмена":
-        await state.clear()
-        return await message.answer("Отменено", reply_markup=main_menu())
-    
-    lines = message.text.split('\n')
-    successes = 0
+def parse_wishes_list(lines: list) -> tuple:
+    """Разбор строк «Название - Сумма»: (записи (номер строки, название, сумма), ошибки)"""
+    items = []
     errors = []
-    
     for i, line in enumerate(lines, 1):
         try:
             title_part, amount_part = line.split('-', 1)
             title = title_part.strip()
-            amount = float(amount_part.strip())
-            
-            if amount <= 0:
+            amount = float(amount_part.strip().replace(',', '.'))
+
+            if not title or amount <= 0:
                 raise ValueError
-                
-            execute('''INSERT INTO wishes (user_id, title, target_amount)
-                     VALUES (?, ?, ?)''',
-                   (message.from_user.id, title, amount))
-            successes += 1
+            items.append((i, title, amount))
         except Exception:
             errors.append(f"Строка {i}: {line}")
+    return items, errors
+
+def insert_wishes(cur, user_id: int, items: list) -> tuple:
+    """Запись желаний одним executemany; уже существующие и повторные названия пропускаются"""
+    if not items:
+        return 0, []
+    titles = list({title for _, title, _ in items})
+    placeholders = ", ".join("?" * len(titles))
+    seen = {row[0] for row in cur.execute(
+        f"SELECT title FROM wishes WHERE user_id = ? AND title IN ({placeholders})",
+        (user_id, *titles)
+    )}
+
+    rows = []
+    duplicates = []
+    for i, title, amount in items:
+        if title in seen:
+            duplicates.append(f"Строка {i}: {title}")
+            continue
+        seen.add(title)
+        rows.append((user_id, title, amount))
+    cur.executemany("INSERT INTO wishes (user_id, title, target_amount) VALUES (?, ?, ?)", rows)
+    return len(rows), duplicates
+
+@router.message(Form.ADD_WISHES_LIST)
+async def process_wishes_list(message: types.Message, state: FSMContext):
+    if message.text == "❌ Отмена":
+        await state.clear()
+        return await message.answer("Отменено", reply_markup=main_menu())
     
-    await state.clear()
+    lines = message.text.split('\n')
+    # Сначала проверяем все строки, затем пишем корректные одной транзакцией
+    items, errors = parse_wishes_list(lines)
+    try:
+        successes, duplicates = await db.transaction(insert_wishes, message.from_user.id, items)
+    except Exception as e:
+        # Список пишется одной транзакцией: при ошибке не добавлено ничего
+        return await message.answer(f"❌ Ошибка, желания не добавлены: {str(e)}", reply_markup=main_menu())
+    finally:
+        await state.clear()
+
     result = f"✅ Успешно добавлено: {successes}\n"
+    if duplicates:
+        result += "\n⚠️ Уже есть в вишлисте:\n" + '\n'.join(duplicates) + "\n"
     if errors:
         result += "\n❌ Ошибки в строках:\n" + '\n'.join(errors)
 
@@ -254,7 +286,7 @@ from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 # Старт выбора желания для редактирования (inline)
 @router.message(Command("edit_wish"))
 async def edit_wish_start(message: types.Message, state: FSMContext):
-    wishes = fetchall("SELECT id, title FROM wishes WHERE user_id = ?", (message.from_user.id,))
+    wishes = await db.fetchall("SELECT id, title FROM wishes WHERE user_id = ?", (message.from_user.id,))
     if not wishes:
         return await message.answer("❌ Список желаний пуст!")
 
@@ -272,7 +304,7 @@ async def edit_wish_choice(callback: types.CallbackQuery, state: FSMContext):
         return await callback.answer("❌ Некорректный выбор")
 
     wish_id = int(callback.data.split("_")[-1])
-    wish = fetchone("SELECT * FROM wishes WHERE user_id = ? AND id = ?", (callback.from_user.id, wish_id))
+    wish = await db.fetchone("SELECT * FROM wishes WHERE user_id = ? AND id = ?", (callback.from_user.id, wish_id))
     if not wish:
         await state.clear()
         return await callback.answer("❌ Желание не найдено", show_alert=True)
@@ -311,7 +343,7 @@ async def handle_edit_field_choice(message: types.Message, state: FSMContext):
 @router.message(Form.EDIT_WISH_TITLE)
 async def edit_title(message: types.Message, state: FSMContext):
     data = await state.get_data()
-    execute("UPDATE wishes SET title = ? WHERE id = ?", (message.text.strip(), data['wish_id']))
+    await db.execute("UPDATE wishes SET title = ? WHERE id = ?", (message.text.strip(), data['wish_id']))
 
     await state.set_state(Form.EDIT_WISH_CHOICE)
     fields = ["✏️ Название", "💬 Описание", "💰 Сумму", "🧾 Всё сразу", "✅ Завершить"]
@@ -321,7 +353,7 @@ async def edit_title(message: types.Message, state: FSMContext):
 @router.message(Form.EDIT_WISH_DESCRIPTION)
 async def edit_description(message: types.Message, state: FSMContext):
     data = await state.get_data()
-    execute("UPDATE wishes SET description = ? WHERE id = ?", (message.text.strip(), data['wish_id']))
+    await db.execute("UPDATE wishes SET description = ? WHERE id = ?", (message.text.strip(), data['wish_id']))
 
     await state.set_state(Form.EDIT_WISH_CHOICE)
     fields = ["✏️ Название", "💬 Описание", "💰 Сумму", "🧾 Всё сразу", "✅ Завершить"]
@@ -336,7 +368,7 @@ async def edit_amount(message: types.Message, state: FSMContext):
             raise ValueError
 
         data = await state.get_data()
-        execute("UPDATE wishes SET target_amount = ? WHERE id = ?", (amount, data['wish_id']))
+        await db.execute("UPDATE wishes SET target_amount = ? WHERE id = ?", (amount, data['wish_id']))
 
         await state.set_state(Form.EDIT_WISH_CHOICE)
         fields = ["✏️ Название", "💬 Описание", "💰 Сумму", "🧾 Всё сразу", "✅ Завершить"]
@@ -361,7 +393,7 @@ async def edit_all(message: types.Message, state: FSMContext):
             raise ValueError
 
         data = await state.get_data()
-        execute("UPDATE wishes SET title = ?, description = ?, target_amount = ? WHERE id = ?",
+        await db.execute("UPDATE wishes SET title = ?, description = ?, target_amount = ? WHERE id = ?",
                 (title, description, amount, data['wish_id']))
 
         await message.answer("✅ Все поля обновлены!", reply_markup=main_menu())
@@ -373,7 +405,7 @@ async def edit_all(message: types.Message, state: FSMContext):
 # Команда: /buy_wish
 @router.message(Command("buy_wish"))
 async def buy_wish_start(message: types.Message, state: FSMContext):
-    wishes = fetchall("SELECT id, title FROM wishes WHERE user_id = ?", (message.from_user.id,))
+    wishes = await db.fetchall("SELECT id, title FROM wishes WHERE user_id = ?", (message.from_user.id,))
     if not wishes:
         return await message.answer("❌ У вас нет активных желаний.")
 
@@ -387,13 +419,13 @@ async def buy_wish_start(message: types.Message, state: FSMContext):
 @router.callback_query(F.data.startswith("buywish_"))
 async def confirm_buy_wish(callback: types.CallbackQuery, state: FSMContext):
     wish_id = int(callback.data.split("_")[1])
-    wish = fetchone("SELECT title, description, target_amount FROM wishes WHERE id = ? AND user_id = ?", (wish_id, callback.from_user.id))
+    wish = await db.fetchone("SELECT title, description, target_amount FROM wishes WHERE id = ? AND user_id = ?", (wish_id, callback.from_user.id))
 
     if not wish:
         return await callback.answer("❌ Желание не найдено", show_alert=True)
 
     title, description, amount = wish
-    balance = fetchone("SELECT balance FROM users WHERE user_id = ?", (callback.from_user.id,))[0]
+    balance = await get_balance(callback.from_user.id)
 
     if balance < amount:
         await state.clear()
@@ -423,6 +455,9 @@ async def confirm_buy_wish(callback: types.CallbackQuery, state: FSMContext):
 @router.callback_query(F.data == "buy_confirm_default")
 async def buy_with_default_amount(callback: types.CallbackQuery, state: FSMContext):
     data = await state.get_data()
+    # Повторное нажатие приходит, когда покупка уже завершена и состояние очищено
+    if 'amount' not in data:
+        return await callback.answer("❌ Покупка уже завершена или отменена")
     await complete_wish_purchase(callback, data['amount'], state)
 
 # Ввод пользовательской суммы
@@ -451,32 +486,28 @@ async def handle_custom_amount(message: types.Message, state: FSMContext):
 async def complete_wish_purchase(message_or_callback, amount: float, state: FSMContext):
     data = await state.get_data()
     user_id = message_or_callback.from_user.id
-    balance = fetchone("SELECT balance FROM users WHERE user_id = ?", (message_or_callback.from_user.id,))[0]
+    description = f"Покупка желания: {data['title']}. {data['description'] or ''}"
 
-    
-    # Обновляем баланс
-    execute(
-        "UPDATE users SET balance = balance - ? WHERE user_id = ?",
-        (amount, user_id)
-    )
+    known = await category_cache.lookup(user_id, ["Покупки"], "expense")
 
-    # Удалить желание
-    execute("DELETE FROM wishes WHERE id = ?", (data['wish_id'],))
+    def purchase(cur) -> bool:
+        # Удалить желание и добавить трату в категорию "Покупки" одним коммитом
+        cur.execute("DELETE FROM wishes WHERE id = ? AND user_id = ?", (data['wish_id'], user_id))
+        if cur.rowcount == 0:
+            # Желание уже куплено или удалено: повторное подтверждение не списывает деньги
+            return False
+        category_id = ledger.resolve_categories(cur, user_id, ["Покупки"], "expense", known)["Покупки"]
+        ledger.add_transaction(cur, user_id, amount, category_id, "expense", description)
+        return True
 
-    # Категория "Покупки"
-    category = fetchone("SELECT id FROM categories WHERE user_id = ? AND name = ? AND type = 'expense'", (user_id, "Покупки"))
-    if not category:
-        execute("INSERT INTO categories (user_id, name, type) VALUES (?, ?, 'expense')", (user_id, "Покупки"))
-        category_id = fetchone("SELECT id FROM categories WHERE user_id = ? AND name = ?", (user_id, "Покупки"))[0]
-    else:
-        category_id = category[0]
-
-    # Добавить в расходы
-    description = f"Покупка желания: {data['title']}. {data['description'] or ''}"
-    execute("""INSERT INTO transactions (user_id, amount, category_id, description)
-               VALUES (?, ?, ?, ?)""", (user_id, amount, category_id, description))
+    purchased = await db.transaction(purchase)
 
     await state.clear()
+    if not purchased:
+        return await message_or_callback.answer(
+            f"❌ Желание '{data['title']}' уже удалено из вишлиста, расход не добавлен.",
+            reply_markup=main_menu()
+        )
     await message_or_callback.answer(
         f"✅ '{data['title']}' куплено за {format_amount(amount)} ₽ и добавлено в расходы!",
         reply_markup=main_menu()
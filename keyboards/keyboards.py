@@ -32,7 +32,7 @@ def main_menu() -> ReplyKeyboardMarkup:
             [KeyboardButton(text="/history")],
 
             # 🧹 Удаление
-            [KeyboardButton(text="/delete_transactions")],
+            [KeyboardButton(text="/delete_transactions"), KeyboardButton(text="/delete_range")],
 
             # ℹ️ Справка и меню
             [KeyboardButton(text="/help"), KeyboardButton(text="/menu")]
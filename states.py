@@ -24,6 +24,9 @@ class Form(StatesGroup):
     COMPARE_MONTHS = State()
     DELETE_CATEGORY = State()
     DELETE_MULTI_TRANSACTIONS = State()
+    DELETE_RANGE_CONFIRM = State()
+    DELETE_RANGE_END = State()
+    DELETE_RANGE_START = State()
     DELETE_TRANSACTION_SELECT = State()
     DELETE_WISH = State()
     EDIT_WISH_ALL = State()
@@ -1,8 +1,10 @@
-from .database import init_db, execute, fetchone, fetchall
+from .database import init_db, close_pool, transaction, execute, fetchone, fetchall
 from .config import logger
 
 __all__ = [
     'init_db',
+    'close_pool',
+    'transaction',
     'execute',
     'fetchone',
     'fetchall',
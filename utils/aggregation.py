@@ -0,0 +1,40 @@
+"""Ряды отчёта из сгруппированных в SQL итогов"""
+from dataclasses import dataclass
+from datetime import datetime
+from itertools import accumulate
+from typing import List, Sequence
+
+
+@dataclass
+class ReportSeries:
+    """Все ряды и итоги, которые нужны графикам и тексту отчёта"""
+    total_income: float
+    total_expense: float
+    day_labels: List[str]         # только дни с операциями, ДД.ММ.ГГГГ
+    daily_income: List[float]
+    daily_expense: List[float]
+    cumulative_daily: List[float]
+    month_labels: List[str]       # только месяцы с операциями, "%b %Y"
+    monthly_income: List[float]
+    monthly_expense: List[float]
+    cumulative_monthly: List[float]
+
+
+def from_totals(daily_rows: Sequence[Sequence], monthly_rows: Sequence[Sequence]) -> ReportSeries:
+    """Ряды из строк, уже сгруппированных в SQL: (YYYY-MM-DD, доход, расход) и (YYYY-MM, доход, расход)"""
+    daily_income = [float(row[1]) for row in daily_rows]
+    daily_expense = [float(row[2]) for row in daily_rows]
+    monthly_income = [float(row[1]) for row in monthly_rows]
+    monthly_expense = [float(row[2]) for row in monthly_rows]
+    return ReportSeries(
+        total_income=sum(daily_income),
+        total_expense=sum(daily_expense),
+        day_labels=[datetime.strptime(row[0], "%Y-%m-%d").strftime("%d.%m.%Y") for row in daily_rows],
+        daily_income=daily_income,
+        daily_expense=daily_expense,
+        cumulative_daily=list(accumulate(i - e for i, e in zip(daily_income, daily_expense))),
+        month_labels=[datetime.strptime(row[0], "%Y-%m").strftime("%b %Y") for row in monthly_rows],
+        monthly_income=monthly_income,
+        monthly_expense=monthly_expense,
+        cumulative_monthly=list(accumulate(i - e for i, e in zip(monthly_income, monthly_expense))),
+    )
@@ -0,0 +1,160 @@
+"""Кэш балансов пользователей"""
+import asyncio
+import json
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from aiogram import Dispatcher
+
+from . import db
+from .config import BALANCE_CACHE_MAX_USERS, BALANCE_RECONCILE_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+
+class BalanceCache:
+    """LRU-кэш балансов.
+
+    Баланс загружается из users при первом чтении, после чего каждая
+    закоммиченная запись (ledger, через database.after_commit) прибавляет
+    к нему своё изменение. Запись отмечается (begin_write) ещё до коммита:
+    пока она не учтена в кэше, прочитанный из БД баланс пользователя в кэш
+    не кладётся, иначе изменение было бы прибавлено дважды. Источник истины -
+    таблица users: периодическая сверка исправляет расхождения, например
+    после записи другим процессом.
+    """
+
+    def __init__(self, max_users: int):
+        self.max_users = max_users
+        self._balances: "OrderedDict[int, float]" = OrderedDict()
+        # Растёт при каждой записи: значение, прочитанное раньше, в кэш не попадёт
+        self._generation = 0
+        # Число начатых, но ещё не учтённых в кэше записей по пользователям
+        self._writes: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int) -> Optional[float]:
+        with self._lock:
+            balance = self._balances.get(user_id)
+            if balance is not None:
+                self._balances.move_to_end(user_id)
+            return balance
+
+    def generation(self) -> int:
+        with self._lock:
+            return self._generation
+
+    def put(self, user_id: int, balance: float, generation: int) -> bool:
+        with self._lock:
+            if generation != self._generation or user_id in self._writes:
+                return False
+            self._balances[user_id] = balance
+            self._balances.move_to_end(user_id)
+            while len(self._balances) > self.max_users:
+                self._balances.popitem(last=False)
+            return True
+
+    def begin_write(self, user_id: int) -> None:
+        """Запись баланса начата в транзакции, которая ещё не закоммичена"""
+        with self._lock:
+            self._generation += 1
+            self._writes[user_id] = self._writes.get(user_id, 0) + 1
+
+    def finish_write(self, user_id: int, delta: Optional[float]) -> None:
+        """Запись закоммичена: прибавить delta; None - баланс задан целиком, перечитать из БД"""
+        with self._lock:
+            self._end_write(user_id)
+            if delta is None:
+                self._balances.pop(user_id, None)
+            elif user_id in self._balances:
+                self._balances[user_id] += delta
+
+    def cancel_write(self, user_id: int) -> None:
+        """Транзакция с записью откатилась"""
+        with self._lock:
+            self._end_write(user_id)
+
+    def _end_write(self, user_id: int) -> None:
+        self._generation += 1
+        self._writes[user_id] -= 1
+        if not self._writes[user_id]:
+            del self._writes[user_id]
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._generation += 1
+            self._balances.pop(user_id, None)
+
+    def snapshot(self) -> Dict[int, float]:
+        with self._lock:
+            return dict(self._balances)
+
+
+balance_cache = BalanceCache(BALANCE_CACHE_MAX_USERS)
+
+
+async def get_balance(user_id: int) -> float:
+    """Баланс пользователя: из кэша или одним запросом к БД"""
+    balance = balance_cache.get(user_id)
+    if balance is not None:
+        return balance
+    generation = balance_cache.generation()
+    row = await db.fetchone("SELECT balance FROM users WHERE user_id = ?", (user_id,))
+    if row is None:
+        return 0.0
+    balance_cache.put(user_id, row[0], generation)
+    return row[0]
+
+async def reconcile() -> int:
+    """Сверка кэша с таблицей users; возвращает число исправленных балансов"""
+    # Версию берём до снимка: запись, учтённая после него, не даст ложного расхождения
+    generation = balance_cache.generation()
+    cached = balance_cache.snapshot()
+    if not cached:
+        return 0
+    rows = await db.fetchall(
+        "SELECT user_id, balance FROM users WHERE user_id IN (SELECT value FROM json_each(?))",
+        (json.dumps(list(cached)),)
+    )
+    stored = dict(rows)
+    fixed = 0
+    for user_id, balance in cached.items():
+        actual = stored.get(user_id)
+        if actual is not None and abs(actual - balance) < 0.005:
+            continue
+        # Пока шёл запрос, была запись: сверим на следующем круге
+        if balance_cache.generation() != generation:
+            break
+        logger.warning(f"Balance cache mismatch for user {user_id}: cached {balance}, stored {actual}")
+        balance_cache.invalidate(user_id)
+        generation = balance_cache.generation()
+        fixed += 1
+    return fixed
+
+_reconcile_task: Optional[asyncio.Task] = None
+
+async def _reconcile_loop(interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await reconcile()
+        except Exception as e:
+            logger.error(f"Balance reconciliation failed: {e}")
+
+async def _start_reconciliation() -> None:
+    global _reconcile_task
+    if BALANCE_RECONCILE_INTERVAL > 0:
+        _reconcile_task = asyncio.create_task(_reconcile_loop(BALANCE_RECONCILE_INTERVAL))
+
+async def _stop_reconciliation() -> None:
+    global _reconcile_task
+    if _reconcile_task is not None:
+        _reconcile_task.cancel()
+        _reconcile_task = None
+
+def setup_balance_cache(dp: Dispatcher) -> None:
+    """Периодическая сверка кэша балансов на время работы диспетчера"""
+    dp.startup.register(_start_reconciliation)
+    dp.shutdown.register(_stop_reconciliation)
@@ -0,0 +1,105 @@
+"""Кэш справочника категорий пользователей"""
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from . import db
+from .config import CATEGORY_CACHE_MAX_USERS
+
+# {тип: {название: id}}, внутри типа - в порядке создания
+Categories = Dict[str, Dict[str, int]]
+
+
+class CategoryCache:
+    """LRU-кэш категорий по пользователям.
+
+    Справочник пользователя загружается одним запросом при первом обращении,
+    дальше название превращается в id поиском в словаре. Категории, созданные
+    на лету, дописываются в кэш после коммита (add), ручные изменения сбрасывают
+    пользователя целиком (invalidate). Изменения в обход этого процесса кэш не
+    видит, поэтому ledger перед записью сверяет взятые из него id с БД.
+    """
+
+    def __init__(self, max_users: int):
+        self.max_users = max_users
+        self._users: "OrderedDict[int, Categories]" = OrderedDict()
+        # Растёт при каждом изменении: загрузка, начатая раньше, не перезапишет свежие данные
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int) -> Optional[Categories]:
+        with self._lock:
+            categories = self._users.get(user_id)
+            if categories is not None:
+                self._users.move_to_end(user_id)
+            return categories
+
+    def generation(self) -> int:
+        with self._lock:
+            return self._generation
+
+    def put(self, user_id: int, categories: Categories, generation: int) -> None:
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._users[user_id] = categories
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+
+    def add(self, user_id: int, type_: str, ids: Dict[str, int]) -> None:
+        """Дописать созданные категории, если справочник пользователя уже загружен"""
+        with self._lock:
+            self._generation += 1
+            categories = self._users.get(user_id)
+            if categories is not None:
+                categories.setdefault(type_, {}).update(ids)
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._generation += 1
+            self._users.pop(user_id, None)
+
+
+category_cache = CategoryCache(CATEGORY_CACHE_MAX_USERS)
+
+
+async def get_categories(user_id: int) -> Categories:
+    """Все категории пользователя: из кэша или одним запросом к БД"""
+    categories = category_cache.get(user_id)
+    if categories is not None:
+        return categories
+    generation = category_cache.generation()
+    rows = await db.fetchall("SELECT type, name, id FROM categories WHERE user_id = ? ORDER BY id", (user_id,))
+    categories = {"income": {}, "expense": {}}
+    for type_, name, category_id in rows:
+        categories.setdefault(type_, {})[name] = category_id
+    category_cache.put(user_id, categories, generation)
+    return categories
+
+async def get_names(user_id: int, type_: Optional[str] = None) -> List[str]:
+    """Названия категорий типа type_ или всех типов в порядке создания"""
+    categories = await get_categories(user_id)
+    if type_ is not None:
+        return list(categories.get(type_, {}))
+    return [name for _, name in sorted(_all_ids(categories))]
+
+async def get_id(user_id: int, name: str, type_: Optional[str] = None) -> Optional[int]:
+    """id категории по названию; без type_ - самая ранняя категория с таким названием"""
+    categories = await get_categories(user_id)
+    if type_ is not None:
+        return categories.get(type_, {}).get(name)
+    ids = [category_id for category_id, category_name in _all_ids(categories) if category_name == name]
+    return min(ids) if ids else None
+
+async def lookup(user_id: int, names: Iterable[str], type_: str) -> Dict[str, int]:
+    """Известные кэшу id категорий по названиям; недостающие создаёт ledger.resolve_categories"""
+    known = (await get_categories(user_id)).get(type_, {})
+    return {name: known[name] for name in names if name in known}
+
+def invalidate(user_id: int) -> None:
+    """Сбросить справочник пользователя после ручного изменения категорий"""
+    category_cache.invalidate(user_id)
+
+def _all_ids(categories: Categories) -> List[Tuple[int, str]]:
+    return [(category_id, name) for ids in categories.values() for name, category_id in ids.items()]
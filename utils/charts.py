@@ -0,0 +1,144 @@
+"""Построение графиков отчёта в пуле процессов, чтобы не блокировать event loop"""
+import asyncio
+import io
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, List, Optional
+
+from .config import REPORT_WORKERS
+
+logger = logging.getLogger(__name__)
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+def _init_worker():
+    """Импорт matplotlib с бэкендом Agg и шрифтов PDF один раз на процесс"""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot  # noqa: F401
+    from .pdf_generator import register_fonts
+    register_fonts()
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=REPORT_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker
+        )
+    return _executor
+
+async def run(func: Callable, *args) -> Any:
+    """Выполнение функции отрисовки в пуле процессов"""
+    global _executor
+    loop = asyncio.get_running_loop()
+    executor = get_executor()
+    try:
+        return await loop.run_in_executor(executor, func, *args)
+    except BrokenProcessPool:
+        # Воркер упал (например, убит по памяти): сломанный пул не восстанавливается,
+        # поэтому создаём новый и повторяем один раз
+        logger.warning("Chart worker pool is broken, restarting")
+        if _executor is executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+        return await loop.run_in_executor(get_executor(), func, *args)
+
+def shutdown() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
+        logger.info("Chart workers stopped")
+
+
+# ------------------- Функции отрисовки (выполняются в воркерах) -------------------
+
+def _to_png(fig) -> bytes:
+    """PNG фигуры в памяти, без временных файлов"""
+    import matplotlib.pyplot as plt
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png")
+    plt.close(fig)
+    return buf.getvalue()
+
+def render_summary(total_income: float, total_expense: float) -> bytes:
+    """Сводная диаграмма"""
+    import matplotlib.pyplot as plt
+    labels = ['Доходы', 'Расходы', 'Баланс']
+    values = [total_income, total_expense, total_income - total_expense]
+    colors = ['green', 'red', 'blue']
+    fig, ax = plt.subplots(figsize=(8, 6))
+    bars = ax.bar(labels, values, color=colors)
+    for bar in bars:
+        height = bar.get_height()
+        ax.text(bar.get_x() + bar.get_width() / 2, height + 50, f'{height:.2f}', ha='center')
+    ax.set_title('Сводная диаграмма')
+    fig.tight_layout()
+    return _to_png(fig)
+
+def render_pie(total_income: float, total_expense: float) -> bytes:
+    """Круговая диаграмма: Доходы и Расходы"""
+    import matplotlib.pyplot as plt
+    labels_pie = ['Доходы', 'Расходы']
+    values_pie = [total_income, total_expense]
+    fig, ax = plt.subplots(figsize=(8, 6))
+    ax.pie(values_pie, labels=labels_pie, autopct='%1.1f%%', colors=['green', 'red'], startangle=90)
+    ax.axis('equal')  # Equal aspect ratio ensures that pie is drawn as a circle.
+    ax.set_title('Доходы и Расходы (круговая диаграмма)')
+    fig.tight_layout()
+    return _to_png(fig)
+
+def render_monthly(months: List[str], income_vals: List[float], expense_vals: List[float]) -> bytes:
+    """Доходы и расходы по месяцам"""
+    import matplotlib.pyplot as plt
+    fig, ax = plt.subplots(figsize=(12, 6))
+    x = range(len(months))
+    ax.bar([i - 0.2 for i in x], income_vals, width=0.4, label='Доходы', color='green')
+    ax.bar([i + 0.2 for i in x], expense_vals, width=0.4, label='Расходы', color='red')
+    ax.set_xticks(x)
+    ax.set_xticklabels(months, rotation=45)
+    ax.set_title("Доходы и расходы по месяцам")
+    ax.legend()
+    fig.tight_layout()
+    return _to_png(fig)
+
+def render_cumulative(months: List[str], cumulative: List[float]) -> bytes:
+    """Накопительный баланс по месяцам"""
+    import matplotlib.pyplot as plt
+    fig, ax = plt.subplots(figsize=(12, 6))
+    ax.plot(months, cumulative, marker='o', color='blue')
+    ax.set_title("Накопительный баланс по месяцам")
+    ax.axhline(0, color='gray', linestyle='--')
+    ax.tick_params(axis='x', labelrotation=45)
+    fig.tight_layout()
+    return _to_png(fig)
+
+def render_timeline(days: List[str], incomes: List[float], expenses: List[float]) -> bytes:
+    """Дневная динамика"""
+    import matplotlib.pyplot as plt
+    balance = [i - e for i, e in zip(incomes, expenses)]
+    fig, ax = plt.subplots(figsize=(14, 6))
+    ax.plot(days, incomes, label='Доходы', color='green', marker='o')
+    ax.plot(days, expenses, label='Расходы', color='red', marker='o')
+    ax.plot(days, balance, label='Баланс (день)', color='blue', linestyle='--', marker='x')
+    ax.set_title("Дневная динамика")
+    ax.legend()
+    ax.tick_params(axis='x', labelrotation=45)
+    fig.tight_layout()
+    return _to_png(fig)
+
+def render_cumulative_daily(days: List[str], cumulative_daily: List[float]) -> bytes:
+    """Накопительный баланс по дням"""
+    import matplotlib.pyplot as plt
+    fig, ax = plt.subplots(figsize=(14, 6))
+    ax.fill_between(days, cumulative_daily, step='pre', color='dodgerblue', alpha=0.4)
+    ax.plot(days, cumulative_daily, marker='o', color='blue')
+    ax.axhline(0, color='gray', linestyle='--')
+    ax.set_title("Накопительный баланс по дням")
+    ax.tick_params(axis='x', labelrotation=45)
+    fig.tight_layout()
+    return _to_png(fig)
@@ -1,5 +1,67 @@
 import logging
 import os
+from dotenv import load_dotenv
+
+# Загрузка переменных окружения до чтения настроек
+load_dotenv()
+
+# Настройки базы данных
+DB_PATH = os.getenv("DB_PATH", "finance.db")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "8192"))
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(64 * 1024 * 1024)))
+
+# Число процессов для отрисовки графиков отчётов
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", "2"))
+# Сколько отчётов строится одновременно, остальные ждут в очереди
+REPORT_MAX_CONCURRENT = int(os.getenv("REPORT_MAX_CONCURRENT", "2"))
+# Кэш готовых отчётов: число записей и суммарный размер в байтах
+REPORT_CACHE_MAX_ENTRIES = int(os.getenv("REPORT_CACHE_MAX_ENTRIES", "64"))
+REPORT_CACHE_MAX_BYTES = int(os.getenv("REPORT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Сжатие CSV-выгрузки: пусто - обычный CSV, gzip или zip
+REPORT_CSV_COMPRESSION = os.getenv("REPORT_CSV_COMPRESSION", "").lower()
+# Сколько байт выгрузки держать в памяти, дальше она пишется во временный файл
+REPORT_CSV_SPOOL_BYTES = int(os.getenv("REPORT_CSV_SPOOL_BYTES", str(1024 * 1024)))
+# Сколько строк операций попадает в PDF; полный список - в сообщениях и CSV
+REPORT_PDF_MAX_LINES = int(os.getenv("REPORT_PDF_MAX_LINES", "2000"))
+
+# Режим получения обновлений: polling или webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+# Адрес и путь, на которых слушает aiohttp-сервер вебхука
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+# Публичный URL вебхука для setWebhook; пусто - вебхук не регистрируется (локальная проверка)
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+# Значение заголовка X-Telegram-Bot-Api-Secret-Token; пусто - без проверки
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+# Сколько обновлений обрабатывается одновременно
+WEBHOOK_MAX_CONCURRENT = int(os.getenv("WEBHOOK_MAX_CONCURRENT", "40"))
+
+# Сколько пользователей обслуживается одновременно; обновления одного пользователя идут по очереди
+UPDATE_MAX_CONCURRENT = int(os.getenv("UPDATE_MAX_CONCURRENT", "32"))
+
+# Хранилище состояний FSM: sqlite (переживает перезапуск, общее для процессов) или memory
+FSM_STORAGE = os.getenv("FSM_STORAGE", "sqlite").lower()
+# Через сколько секунд изменения состояний пачкой записываются в БД
+FSM_FLUSH_INTERVAL = float(os.getenv("FSM_FLUSH_INTERVAL", "0.05"))
+# Сколько секунд прочитанное состояние считается актуальным без обращения к БД.
+# 0 - читать из БД каждый раз: состояние общее для процессов за вебхуком
+FSM_CACHE_TTL = float(os.getenv("FSM_CACHE_TTL", "0"))
+FSM_CACHE_MAX_ENTRIES = int(os.getenv("FSM_CACHE_MAX_ENTRIES", "10000"))
+
+# Для скольких пользователей держать в памяти справочник категорий
+CATEGORY_CACHE_MAX_USERS = int(os.getenv("CATEGORY_CACHE_MAX_USERS", "10000"))
+# Кэш балансов: размер и период сверки с таблицей users (секунды, 0 - не сверять)
+BALANCE_CACHE_MAX_USERS = int(os.getenv("BALANCE_CACHE_MAX_USERS", "10000"))
+BALANCE_RECONCILE_INTERVAL = float(os.getenv("BALANCE_RECONCILE_INTERVAL", "300"))
+
+# Метрики обработчиков и запросов к БД, отдаются в формате Prometheus
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "0").lower() in ("1", "true", "yes")
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+# Обновления дольше порога (мс) пишутся в лог; 0 - не писать
+METRICS_SLOW_UPDATE_MS = float(os.getenv("METRICS_SLOW_UPDATE_MS", "1000"))
 
 def setup_logger():
     """Конфигурация логгера"""
@@ -1,95 +1,350 @@
 import sqlite3
 import logging
-from typing import List, Tuple, Optional
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, List, Tuple, Optional, Iterator, Union
+
+from .config import DB_PATH, DB_POOL_SIZE, DB_CACHE_SIZE_KB, DB_MMAP_SIZE, METRICS_ENABLED
 
 logger = logging.getLogger(__name__)
 
+
+class QueryStats:
+    """Число запросов и время работы с БД в рамках одного обновления"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, count: int = 0, seconds: float = 0.0) -> None:
+        # Запросы одного обновления могут идти из нескольких потоков пула
+        with self._lock:
+            self.count += count
+            self.seconds += seconds
+
+# Статистика текущего обновления (utils/metrics.py); None - не собирается
+query_stats: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+_CONTROL_STATEMENTS = ("BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE", "PRAGMA")
+
+def _trace_statement(statement: str) -> None:
+    """trace-callback соединения: считает выполненные запросы без служебных"""
+    stats = query_stats.get()
+    if stats is not None and not statement.lstrip().upper().startswith(_CONTROL_STATEMENTS):
+        stats.add(count=1)
+
+
+class ConnectionPool:
+    """Пул постоянных соединений SQLite"""
+
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self.size = max(1, size)
+        self._idle = queue.LifoQueue(maxsize=self.size)
+        self._created = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _connect(self) -> sqlite3.Connection:
+        """Открытие соединения и настройка PRAGMA"""
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE_KB}")
+        conn.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+        if METRICS_ENABLED:
+            conn.set_trace_callback(_trace_statement)
+        logger.debug(f"Opened pooled connection to {self.path}")
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        """Взять соединение из пула (или открыть новое, если лимит не исчерпан)"""
+        if self._closed:
+            raise sqlite3.ProgrammingError("Connection pool is closed")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_create = self._created < self.size
+            if can_create:
+                self._created += 1
+        if can_create:
+            try:
+                return self._connect()
+            except sqlite3.Error:
+                with self._lock:
+                    self._created -= 1
+                raise
+        return self._idle.get()
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        """Вернуть соединение в пул"""
+        if self._closed:
+            conn.close()
+            return
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        stats = query_stats.get()
+        started = time.perf_counter() if stats is not None else 0.0
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+            if stats is not None:
+                stats.add(seconds=time.perf_counter() - started)
+
+    def close(self) -> None:
+        """Закрыть все простаивающие соединения; занятые закроются при возврате"""
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        logger.info("Database connection pool closed")
+
+
+_pool: Optional[ConnectionPool] = None
+# Действия после коммита транзакции, открытой в этом потоке (after_commit)
+_local = threading.local()
+_pool_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    """Ленивое создание общего пула соединений"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DB_PATH, DB_POOL_SIZE)
+    return _pool
+
+def close_pool() -> None:
+    """Закрытие пула при остановке бота"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+# Миграции схемы. Миграция с номером N (позиция в списке + 1) применяется, если
+# PRAGMA user_version < N; шаг - SQL-строка или функция, принимающая соединение.
+MIGRATIONS: List[List[Union[str, Callable[[sqlite3.Connection], None]]]] = [
+    # 1: индексы для истории, отчётов, категорий и вишлиста
+    [
+        "CREATE INDEX IF NOT EXISTS idx_transactions_user_created ON transactions(user_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_categories_user_type_name ON categories(user_id, type, name)",
+        "CREATE INDEX IF NOT EXISTS idx_wishes_user_target ON wishes(user_id, target_amount, title)",
+    ],
+    # 2: нормализованный день транзакции (YYYY-MM-DD) для поиска по диапазону дат
+    [
+        "ALTER TABLE transactions ADD COLUMN day TEXT",
+        "UPDATE transactions SET day = date(created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_transactions_user_day ON transactions(user_id, day)",
+        # Страховка для вставок в обход ledger
+        """CREATE TRIGGER IF NOT EXISTS trg_transactions_day AFTER INSERT ON transactions
+           WHEN NEW.day IS NULL
+           BEGIN
+               UPDATE transactions SET day = date(NEW.created_at) WHERE id = NEW.id;
+           END""",
+    ],
+    # 3: счётчики транзакций по типам для истории (ведутся в utils/ledger.py);
+    # транзакции удалённых категорий в истории не видны и не считаются
+    [
+        """CREATE TABLE IF NOT EXISTS transaction_counts (
+               user_id INTEGER NOT NULL,
+               type TEXT NOT NULL,
+               count INTEGER NOT NULL DEFAULT 0,
+               PRIMARY KEY (user_id, type))""",
+        """INSERT OR REPLACE INTO transaction_counts (user_id, type, count)
+           SELECT t.user_id, c.type, COUNT(*)
+           FROM transactions t
+           JOIN categories c ON t.category_id = c.id
+           GROUP BY t.user_id, c.type""",
+    ],
+    # 4: дневные итоги по категориям для отчётов (ведутся в utils/ledger.py)
+    [
+        """CREATE TABLE IF NOT EXISTS daily_totals (
+               user_id INTEGER NOT NULL,
+               day TEXT NOT NULL,
+               category_id INTEGER NOT NULL,
+               income REAL NOT NULL DEFAULT 0,
+               expense REAL NOT NULL DEFAULT 0,
+               count INTEGER NOT NULL DEFAULT 0,
+               PRIMARY KEY (user_id, day, category_id))""",
+        """INSERT OR REPLACE INTO daily_totals (user_id, day, category_id, income, expense, count)
+           SELECT t.user_id, t.day, t.category_id,
+                  SUM(CASE WHEN c.type = 'income' THEN t.amount ELSE 0 END),
+                  SUM(CASE WHEN c.type = 'income' THEN 0 ELSE t.amount END),
+                  COUNT(*)
+           FROM transactions t
+           JOIN categories c ON t.category_id = c.id
+           GROUP BY t.user_id, t.day, t.category_id""",
+    ],
+    # 5: версия данных пользователя для кэша отчётов (растёт при каждой записи транзакций)
+    [
+        "ALTER TABLE users ADD COLUMN data_version INTEGER NOT NULL DEFAULT 0",
+    ],
+    # 6: состояния FSM, общие для всех процессов бота (utils/fsm_storage.py)
+    [
+        """CREATE TABLE IF NOT EXISTS fsm_storage (
+               key TEXT PRIMARY KEY,
+               state TEXT,
+               data TEXT NOT NULL DEFAULT '{}')""",
+    ],
+]
+
+def migrate(conn: sqlite3.Connection) -> None:
+    """Применение недостающих миграций, каждая - в своей транзакции"""
+    for version, steps in enumerate(MIGRATIONS, start=1):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Версию читаем под блокировкой записи: другой процесс мог уже мигрировать
+            current = conn.execute("PRAGMA user_version").fetchone()[0]
+            if current >= version:
+                conn.rollback()
+                continue
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+            logger.info(f"Database migrated to version {version}")
+        except sqlite3.Error as e:
+            conn.rollback()
+            logger.error(f"Migration {version} failed: {e}")
+            raise
+
+# UPDATE ... FROM появился в SQLite 3.33, RETURNING - в 3.35
+MIN_SQLITE_VERSION = (3, 35, 0)
+
+def check_sqlite_version() -> None:
+    """Остановка при запуске, если библиотека SQLite слишком старая для запросов ledger"""
+    if sqlite3.sqlite_version_info < MIN_SQLITE_VERSION:
+        required = ".".join(map(str, MIN_SQLITE_VERSION))
+        raise RuntimeError(
+            f"SQLite {sqlite3.sqlite_version} is too old: {required} or newer is required "
+            f"(UPDATE ... FROM, RETURNING)"
+        )
+
 def init_db():
     """Инициализация структуры базы данных"""
-    conn = sqlite3.connect('finance.db')
-    c = conn.cursor()
-    
-    try:
-        # Пользователи
-        c.execute('''CREATE TABLE IF NOT EXISTS users (
-                    user_id INTEGER PRIMARY KEY,
-                    balance REAL DEFAULT 0)''')
-        
-        # Категории
-        c.execute('''CREATE TABLE IF NOT EXISTS categories (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    name TEXT NOT NULL,
-                    type TEXT CHECK(type IN ('income', 'expense')),
-                    UNIQUE(user_id, name, type))''')
-        
-        # Транзакции
-        c.execute('''CREATE TABLE IF NOT EXISTS transactions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    amount REAL NOT NULL,  
-                    category_id INTEGER NOT NULL,
-                    description TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
-        
-        # Вишлист
-        c.execute('''CREATE TABLE IF NOT EXISTS wishes (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    title TEXT NOT NULL,
-                    description TEXT,
-                    target_amount REAL NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
-        
-        conn.commit()
-        logger.info("Database initialized successfully")
-        
-    except sqlite3.Error as e:
-        logger.error(f"Database initialization error: {e}")
-        raise
-    finally:
-        conn.close()
+    check_sqlite_version()
+    with get_pool().connection() as conn:
+        c = conn.cursor()
+
+        try:
+            # Пользователи
+            c.execute('''CREATE TABLE IF NOT EXISTS users (
+                        user_id INTEGER PRIMARY KEY,
+                        balance REAL DEFAULT 0)''')
+
+            # Категории
+            c.execute('''CREATE TABLE IF NOT EXISTS categories (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        user_id INTEGER NOT NULL,
+                        name TEXT NOT NULL,
+                        type TEXT CHECK(type IN ('income', 'expense')),
+                        UNIQUE(user_id, name, type))''')
+
+            # Транзакции
+            c.execute('''CREATE TABLE IF NOT EXISTS transactions (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        user_id INTEGER NOT NULL,
+                        amount REAL NOT NULL,
+                        category_id INTEGER NOT NULL,
+                        description TEXT,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+
+            # Вишлист
+            c.execute('''CREATE TABLE IF NOT EXISTS wishes (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        user_id INTEGER NOT NULL,
+                        title TEXT NOT NULL,
+                        description TEXT,
+                        target_amount REAL NOT NULL,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+
+            conn.commit()
+            migrate(conn)
+            logger.info("Database initialized successfully")
+
+        except sqlite3.Error as e:
+            logger.error(f"Database initialization error: {e}")
+            raise
+
+@contextmanager
+def transaction() -> Iterator[sqlite3.Cursor]:
+    """Единица работы: все запросы внутри блока фиксируются одним коммитом"""
+    with get_pool().connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        _local.on_commit, _local.on_rollback = [], []
+        try:
+            yield conn.cursor()
+            conn.commit()
+        except BaseException as e:
+            conn.rollback()
+            logger.error(f"Transaction rolled back: {e}")
+            for callback in _local.on_rollback:
+                callback()
+            raise
+        else:
+            for callback in _local.on_commit:
+                callback()
+        finally:
+            _local.on_commit = _local.on_rollback = None
+
+def after_commit(callback: Callable[[], None], on_rollback: Optional[Callable[[], None]] = None) -> None:
+    """Вызов callback после коммита текущей транзакции, on_rollback - после её отката"""
+    pending = getattr(_local, "on_commit", None)
+    if pending is None:
+        callback()
+        return
+    pending.append(callback)
+    if on_rollback is not None:
+        _local.on_rollback.append(on_rollback)
 
 def execute(query: str, args: tuple = ()) -> None:
     """Выполнение запроса на запись"""
-    try:
-        conn = sqlite3.connect('finance.db')
-        c = conn.cursor()
-        c.execute(query, args)
-        conn.commit()
-        logger.debug(f"Executed: {query} | Args: {args}")
-    except sqlite3.Error as e:
-        logger.error(f"Execute error: {e} | Query: {query}")
-        raise
-    finally:
-        conn.close()
+    with get_pool().connection() as conn:
+        try:
+            conn.execute(query, args)
+            conn.commit()
+            logger.debug(f"Executed: {query} | Args: {args}")
+        except sqlite3.Error as e:
+            logger.error(f"Execute error: {e} | Query: {query}")
+            raise
 
 def fetchone(query: str, args: tuple = ()) -> Optional[tuple]:
     """Получение одной записи"""
-    try:
-        conn = sqlite3.connect('finance.db')
-        c = conn.cursor()
-        c.execute(query, args)
-        result = c.fetchone()
-        logger.debug(f"Fetched one: {result} | Query: {query}")
-        return result
-    except sqlite3.Error as e:
-        logger.error(f"Fetchone error: {e} | Query: {query}")
-        raise
-    finally:
-        conn.close()
+    with get_pool().connection() as conn:
+        try:
+            result = conn.execute(query, args).fetchone()
+            logger.debug(f"Fetched one: {result} | Query: {query}")
+            return result
+        except sqlite3.Error as e:
+            logger.error(f"Fetchone error: {e} | Query: {query}")
+            raise
 
 def fetchall(query: str, args: tuple = ()) -> List[Tuple]:
     """Получение всех записей"""
-    try:
-        conn = sqlite3.connect('finance.db')
-        c = conn.cursor()
-        c.execute(query, args)
-        result = c.fetchall()
-        logger.debug(f"Fetched {len(result)} rows | Query: {query}")
-        return result
-    except sqlite3.Error as e:
-        logger.error(f"Fetchall error: {e} | Query: {query}")
-        raise
-    finally:
-        conn.close()
\ No newline at end of file
+    with get_pool().connection() as conn:
+        try:
+            result = conn.execute(query, args).fetchall()
+            logger.debug(f"Fetched {len(result)} rows | Query: {query}")
+            return result
+        except sqlite3.Error as e:
+            logger.error(f"Fetchall error: {e} | Query: {query}")
+            raise
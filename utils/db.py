@@ -0,0 +1,67 @@
+import asyncio
+import contextvars
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, AsyncGenerator, Callable, List, Optional, Tuple
+
+from . import database
+from .config import DB_POOL_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Потоков столько же, сколько соединений в пуле: поток никогда не ждёт соединение
+_executor: Optional[ThreadPoolExecutor] = None
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=DB_POOL_SIZE, thread_name_prefix="db")
+    return _executor
+
+async def run(func: Callable, *args, **kwargs) -> Any:
+    """Выполнение синхронной функции работы с БД вне event loop"""
+    loop = asyncio.get_running_loop()
+    call = partial(func, *args, **kwargs)
+    if database.query_stats.get() is not None:
+        # run_in_executor не переносит contextvars в поток: передаём статистику обновления явно
+        call = partial(contextvars.copy_context().run, call)
+    return await loop.run_in_executor(_get_executor(), call)
+
+async def execute(query: str, args: tuple = ()) -> None:
+    """Асинхронный запрос на запись"""
+    await run(database.execute, query, args)
+
+async def fetchone(query: str, args: tuple = ()) -> Optional[tuple]:
+    """Асинхронное получение одной записи"""
+    return await run(database.fetchone, query, args)
+
+async def fetchall(query: str, args: tuple = ()) -> List[Tuple]:
+    """Асинхронное получение всех записей"""
+    return await run(database.fetchall, query, args)
+
+async def iterate(query: str, args: tuple = (), batch_size: int = 1000) -> AsyncGenerator[List[Tuple], None]:
+    """Чтение большой выборки пачками fetchmany; соединение занято, пока идёт обход"""
+    pool = database.get_pool()
+    conn = await run(pool.acquire)
+    try:
+        cursor = await run(conn.execute, query, args)
+        while rows := await run(cursor.fetchmany, batch_size):
+            yield rows
+    finally:
+        pool.release(conn)
+
+async def transaction(func: Callable, *args) -> Any:
+    """Выполнение func(cursor, *args) в одной транзакции вне event loop"""
+    def _run():
+        with database.transaction() as cur:
+            return func(cur, *args)
+    return await run(_run)
+
+def shutdown() -> None:
+    """Дождаться выполнения запросов и остановить пул потоков"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+        logger.info("Database executor stopped")
@@ -0,0 +1,29 @@
+"""Последовательная обработка обновлений одного пользователя"""
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator
+
+from aiogram.fsm.storage.base import BaseEventIsolation, StorageKey
+
+from .config import UPDATE_MAX_CONCURRENT
+from .keyed_locks import KeyedLocks
+
+
+class UserEventIsolation(BaseEventIsolation):
+    """Обновления одного пользователя выполняются по очереди, разных - параллельно.
+
+    Блокировку берёт FSMContextMiddleware до чтения состояния, поэтому второе
+    нажатие кнопки видит состояние, уже изменённое первым. Общий семафор
+    ограничивает число одновременно обрабатываемых пользователей; блокировки
+    хранятся только пока у пользователя есть обновления в работе.
+    """
+
+    def __init__(self, max_concurrent: int = UPDATE_MAX_CONCURRENT):
+        self._locks = KeyedLocks(max_concurrent)
+
+    @asynccontextmanager
+    async def lock(self, key: StorageKey) -> AsyncGenerator[None, None]:
+        async with self._locks.hold(key.user_id):
+            yield
+
+    async def close(self) -> None:
+        self._locks.clear()
@@ -0,0 +1,83 @@
+"""Потоковая выгрузка операций в CSV: память не зависит от числа строк"""
+import csv
+import gzip
+import io
+import tempfile
+import zipfile
+from typing import AsyncGenerator, BinaryIO, Tuple
+
+from aiogram.types.input_file import InputFile
+
+from . import database, db
+from .config import REPORT_CSV_COMPRESSION, REPORT_CSV_SPOOL_BYTES
+
+# Строк за один fetchmany
+FETCH_SIZE = 1000
+
+CSV_HEADER = ["Дата", "Тип", "Категория", "Сумма", "Описание"]
+
+
+class StreamInputFile(InputFile):
+    """Отправка в Telegram из файлового объекта частями, без чтения целиком"""
+
+    def __init__(self, file: BinaryIO, filename: str):
+        super().__init__(filename=filename)
+        self.file = file
+
+    async def read(self, bot) -> AsyncGenerator[bytes, None]:
+        self.file.seek(0)
+        while chunk := self.file.read(self.chunk_size):
+            yield chunk
+
+
+def _open_container(spool: BinaryIO, compression: str, csv_name: str):
+    """Поток для записи CSV и объект, который нужно закрыть после записи"""
+    if compression == "gzip":
+        stream = gzip.GzipFile(filename=csv_name, mode="wb", fileobj=spool)
+        return stream, stream
+    if compression == "zip":
+        archive = zipfile.ZipFile(spool, "w", compression=zipfile.ZIP_DEFLATED)
+        return archive.open(csv_name, "w", force_zip64=True), archive
+    return spool, None
+
+def write_transactions_csv(user_id: int, start: str, end: str,
+                           compression: str = REPORT_CSV_COMPRESSION) -> Tuple[BinaryIO, str]:
+    """CSV операций за период во временный файл; возвращает файл и расширение.
+
+    Выполняется в потоке БД: строки читаются курсором по FETCH_SIZE.
+    """
+    extension = {"gzip": ".csv.gz", "zip": ".zip"}.get(compression, ".csv")
+    spool = tempfile.SpooledTemporaryFile(max_size=REPORT_CSV_SPOOL_BYTES)
+    stream, container = _open_container(spool, compression, f"report_{start}_{end}.csv")
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    writer = csv.writer(text)
+    writer.writerow(CSV_HEADER)
+
+    with database.get_pool().connection() as conn:
+        cursor = conn.execute('''
+            SELECT strftime('%d.%m.%Y', t.day), c.type, c.name, t.amount, t.description
+            FROM transactions t
+            JOIN categories c ON t.category_id = c.id
+            WHERE t.user_id = ? AND t.day BETWEEN ? AND ?
+            ORDER BY t.day, t.id
+        ''', (user_id, start, end))
+        while rows := cursor.fetchmany(FETCH_SIZE):
+            writer.writerows(
+                (date_str, "Доход" if type_ == "income" else "Расход", category,
+                 f"{amount:.2f}", description or "")
+                for date_str, type_, category, amount, description in rows
+            )
+
+    # Отсоединяем обёртки, не закрывая сам spool
+    text.flush()
+    text.detach()
+    if container is not None:
+        if stream is not container:
+            stream.close()
+        container.close()
+    spool.seek(0, io.SEEK_END)
+    return spool, extension
+
+async def export_transactions_csv(user_id: int, start: str, end: str) -> Tuple[BinaryIO, str]:
+    """Асинхронная выгрузка CSV в потоке БД"""
+    return await db.run(write_transactions_csv, user_id, start, end)
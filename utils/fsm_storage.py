@@ -0,0 +1,149 @@
+"""Хранилище состояний FSM в SQLite с пакетной записью и кэшем чтения"""
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+from . import db
+from .config import FSM_FLUSH_INTERVAL, FSM_CACHE_TTL, FSM_CACHE_MAX_ENTRIES
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Entry:
+    state: Optional[str]
+    data: str           # JSON: get_data каждый раз отдаёт новую копию
+    loaded_at: float
+
+
+def _write_entries(cur, upserts: List[Tuple[str, Optional[str], str]], deletes: List[Tuple[str]]) -> None:
+    if upserts:
+        cur.executemany(
+            """INSERT INTO fsm_storage (key, state, data) VALUES (?, ?, ?)
+               ON CONFLICT(key) DO UPDATE SET state = excluded.state, data = excluded.data""",
+            upserts
+        )
+    if deletes:
+        cur.executemany("DELETE FROM fsm_storage WHERE key = ?", deletes)
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM-хранилище в таблице fsm_storage.
+
+    Изменения сначала попадают в кэш процесса и записываются в БД одной
+    транзакцией раз в flush_interval; до коммита такие записи читаются только
+    из кэша. Прочитанные из БД состояния берутся из кэша cache_ttl секунд -
+    это безопасно, только если пользователь всегда попадает в один процесс.
+    """
+
+    def __init__(
+        self,
+        key_builder: Optional[KeyBuilder] = None,
+        flush_interval: float = FSM_FLUSH_INTERVAL,
+        cache_ttl: float = FSM_CACHE_TTL,
+        cache_max_entries: int = FSM_CACHE_MAX_ENTRIES
+    ):
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self.flush_interval = flush_interval
+        self.cache_ttl = cache_ttl
+        self.cache_max_entries = cache_max_entries
+        self._cache: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._dirty: set = set()
+        # Записи, которые сейчас пишет flush: до коммита в БД ещё старые значения
+        self._in_flight: set = set()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+
+    async def _load(self, key: StorageKey) -> Tuple[str, _Entry]:
+        k = self.key_builder.build(key)
+        entry = self._cache.get(k)
+        if entry is not None and (self._pinned(k) or time.monotonic() - entry.loaded_at < self.cache_ttl):
+            self._cache.move_to_end(k)
+            return k, entry
+
+        row = await db.fetchone("SELECT state, data FROM fsm_storage WHERE key = ?", (k,))
+        # Пока шёл запрос, запись могла измениться в этом процессе
+        if self._pinned(k):
+            return k, self._cache[k]
+        entry = _Entry(row[0], row[1], time.monotonic()) if row else _Entry(None, "{}", time.monotonic())
+        self._cache[k] = entry
+        self._cache.move_to_end(k)
+        self._evict()
+        return k, entry
+
+    def _pinned(self, k: str) -> bool:
+        """Запись ещё не зафиксирована в БД: её значение есть только в кэше"""
+        return k in self._dirty or k in self._in_flight
+
+    def _evict(self) -> None:
+        """Вытеснение старых записей, кроме ещё не записанных в БД"""
+        for k in list(self._cache):
+            if len(self._cache) <= self.cache_max_entries:
+                break
+            if not self._pinned(k):
+                del self._cache[k]
+
+    def _mark_dirty(self, k: str, entry: _Entry) -> None:
+        entry.loaded_at = time.monotonic()
+        self._dirty.add(k)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        # Изменения, пришедшие во время записи, уходят следующей пачкой
+        while self._dirty:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Запись накопленных изменений одной транзакцией"""
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            keys, self._dirty = self._dirty, set()
+            self._in_flight |= keys
+            upserts, deletes = [], []
+            for k in keys:
+                entry = self._cache[k]
+                if entry.state is None and entry.data == "{}":
+                    deletes.append((k,))
+                else:
+                    upserts.append((k, entry.state, entry.data))
+            try:
+                await db.transaction(_write_entries, upserts, deletes)
+            except Exception as e:
+                # Не записанное вернём в очередь: повторится следующей пачкой или при закрытии
+                self._dirty |= keys
+                logger.error(f"FSM flush failed: {e}")
+            finally:
+                self._in_flight -= keys
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        k, entry = await self._load(key)
+        entry.state = state.state if isinstance(state, State) else state
+        self._mark_dirty(k, entry)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._load(key))[1].state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise TypeError(f"Data must be a dict, got {type(data).__name__}")
+        k, entry = await self._load(key)
+        entry.data = json.dumps(data, ensure_ascii=False)
+        self._mark_dirty(k, entry)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return json.loads((await self._load(key))[1].data)
+
+    async def close(self) -> None:
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+        await self.flush()
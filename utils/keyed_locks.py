@@ -0,0 +1,41 @@
+"""Очереди по ключу с общим лимитом одновременных задач"""
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator, Dict, Hashable
+
+
+class KeyedLocks:
+    """Задачи с одним ключом выполняются по очереди, с разными - параллельно, но не больше max_concurrent.
+
+    Сначала берётся блокировка ключа, затем общий слот: ожидающий своей
+    очереди не занимает слот. Блокировка хранится, только пока по ключу
+    есть задачи.
+    """
+
+    def __init__(self, max_concurrent: int):
+        self._semaphore = asyncio.Semaphore(max(1, max_concurrent))
+        self._locks: Dict[Hashable, asyncio.Lock] = {}
+        self._refs: Dict[Hashable, int] = {}
+
+    def busy(self, key: Hashable) -> bool:
+        """Задаче с этим ключом сейчас пришлось бы ждать"""
+        lock = self._locks.get(key)
+        return (lock is not None and lock.locked()) or self._semaphore.locked()
+
+    @asynccontextmanager
+    async def hold(self, key: Hashable) -> AsyncGenerator[None, None]:
+        self._refs[key] = self._refs.get(key, 0) + 1
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        try:
+            async with lock:
+                async with self._semaphore:
+                    yield
+        finally:
+            self._refs[key] -= 1
+            if not self._refs[key]:
+                del self._refs[key]
+                del self._locks[key]
+
+    def clear(self) -> None:
+        self._locks.clear()
+        self._refs.clear()
@@ -0,0 +1,225 @@
+"""Денежные операции: выполняются внутри db.transaction и получают курсор"""
+import json
+import sqlite3
+from collections import defaultdict
+from functools import partial
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from . import database
+from .balance_cache import balance_cache
+from .category_cache import category_cache
+
+
+def _bump_count(cur: sqlite3.Cursor, user_id: int, type_: str, delta: int) -> None:
+    """Поддержка счётчика транзакций пользователя по типу"""
+    cur.execute(
+        """INSERT INTO transaction_counts (user_id, type, count) VALUES (?, ?, ?)
+           ON CONFLICT(user_id, type) DO UPDATE SET count = count + excluded.count""",
+        (user_id, type_, delta)
+    )
+
+def _apply_daily(cur: sqlite3.Cursor, tx_id: int, type_: str, amount: float, count: int) -> None:
+    """Изменение строки daily_totals для дня и категории транзакции tx_id"""
+    income, expense = (amount, 0) if type_ == "income" else (0, amount)
+    cur.execute(
+        """INSERT INTO daily_totals (user_id, day, category_id, income, expense, count)
+           SELECT user_id, day, category_id, ?, ?, ? FROM transactions WHERE id = ?
+           ON CONFLICT(user_id, day, category_id) DO UPDATE SET
+               income = income + excluded.income,
+               expense = expense + excluded.expense,
+               count = count + excluded.count""",
+        (income, expense, count, tx_id)
+    )
+
+def _change_balance(cur: sqlite3.Cursor, user_id: int, delta: float) -> Optional[float]:
+    """Изменение баланса и версии данных; то же изменение после коммита получает кэш балансов"""
+    rows = cur.execute(
+        "UPDATE users SET balance = balance + ?, data_version = data_version + 1 WHERE user_id = ? RETURNING balance",
+        (delta, user_id)
+    ).fetchall()
+    _track_balance_write(user_id, delta)
+    return rows[0][0] if rows else None
+
+def set_balance(cur: sqlite3.Cursor, user_id: int, balance: float) -> None:
+    """Установка баланса вручную; кэш перечитает его из БД"""
+    cur.execute("UPDATE users SET balance = ? WHERE user_id = ?", (balance, user_id))
+    _track_balance_write(user_id, None)
+
+def _track_balance_write(user_id: int, delta: Optional[float]) -> None:
+    """Кэш балансов не принимает значения из БД, пока запись не закоммичена и не учтена"""
+    balance_cache.begin_write(user_id)
+    database.after_commit(partial(balance_cache.finish_write, user_id, delta),
+                          on_rollback=partial(balance_cache.cancel_write, user_id))
+
+def add_transaction(cur: sqlite3.Cursor, user_id: int, amount: float, category_id: int,
+                    type_: str, description: Optional[str] = None,
+                    created_at: Optional[str] = None) -> Optional[float]:
+    """Запись транзакции и изменение баланса на её сумму; возвращает новый баланс"""
+    tx_id = cur.execute(
+        """INSERT INTO transactions (user_id, amount, category_id, description, created_at, day)
+           VALUES (?1, ?2, ?3, ?4, COALESCE(?5, CURRENT_TIMESTAMP), date(COALESCE(?5, CURRENT_TIMESTAMP)))""",
+        (user_id, amount, category_id, description, created_at)
+    ).lastrowid
+    balance = _change_balance(cur, user_id, amount if type_ == "income" else -amount)
+    _bump_count(cur, user_id, type_, 1)
+    _apply_daily(cur, tx_id, type_, amount, 1)
+    return balance
+
+def get_or_create_categories(cur: sqlite3.Cursor, user_id: int, names: Iterable[str], type_: str) -> Dict[str, int]:
+    """id категорий пользователя по именам; отсутствующие создаются"""
+    names = list(dict.fromkeys(names))
+    if not names:
+        return {}
+    cur.executemany("INSERT OR IGNORE INTO categories (user_id, name, type) VALUES (?, ?, ?)",
+                    [(user_id, name, type_) for name in names])
+    placeholders = ", ".join("?" * len(names))
+    rows = cur.execute(
+        f"SELECT name, id FROM categories WHERE user_id = ? AND type = ? AND name IN ({placeholders})",
+        (user_id, type_, *names)
+    ).fetchall()
+    return dict(rows)
+
+def resolve_categories(cur: sqlite3.Cursor, user_id: int, names: Iterable[str], type_: str,
+                       known: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+    """id категорий по именам внутри транзакции записи.
+
+    known - id из кэша категорий; они проверяются одним запросом по первичному
+    ключу, потому что категорию мог удалить другой процесс. Отсутствующие и
+    устаревшие категории ищутся и создаются, кэш узнаёт о них после коммита.
+    """
+    names = list(dict.fromkeys(names))
+    ids = {name: known[name] for name in names if known and name in known}
+    stale = False
+    if ids:
+        placeholders = ", ".join("?" * len(ids))
+        alive = set(cur.execute(
+            f"SELECT name, id FROM categories WHERE user_id = ? AND type = ? AND id IN ({placeholders})",
+            (user_id, type_, *ids.values())
+        ).fetchall())
+        stale = len(alive) != len(ids)
+        ids = {name: category_id for name, category_id in ids.items() if (name, category_id) in alive}
+    missing = [name for name in names if name not in ids]
+    if missing:
+        created = get_or_create_categories(cur, user_id, missing, type_)
+        ids.update(created)
+        if stale:
+            database.after_commit(partial(category_cache.invalidate, user_id))
+        else:
+            database.after_commit(partial(category_cache.add, user_id, type_, created))
+    return ids
+
+def add_transactions(cur: sqlite3.Cursor, user_id: int, type_: str,
+                     items: Sequence[Tuple[str, float, Optional[str]]],
+                     created_at: Optional[str] = None,
+                     known_ids: Optional[Dict[str, int]] = None) -> int:
+    """Пакетная запись транзакций (категория, сумма, описание) одного типа и одной даты.
+
+    Категории, итоги дня, счётчик и баланс обновляются одним запросом на пачку.
+    known_ids - id категорий из кэша; недостающие создаются в этой же транзакции.
+    """
+    if not items:
+        return 0
+    category_ids = resolve_categories(cur, user_id, (name for name, _, _ in items), type_, known_ids)
+    cur.executemany(
+        """INSERT INTO transactions (user_id, amount, category_id, description, created_at, day)
+           VALUES (?1, ?2, ?3, ?4, COALESCE(?5, CURRENT_TIMESTAMP), date(COALESCE(?5, CURRENT_TIMESTAMP)))""",
+        [(user_id, amount, category_ids[name], description, created_at) for name, amount, description in items]
+    )
+
+    per_category: Dict[int, List[float]] = defaultdict(lambda: [0.0, 0])
+    for name, amount, _ in items:
+        totals = per_category[category_ids[name]]
+        totals[0] += amount
+        totals[1] += 1
+    income = type_ == "income"
+    cur.executemany(
+        """INSERT INTO daily_totals (user_id, day, category_id, income, expense, count)
+           VALUES (?, date(COALESCE(?, CURRENT_TIMESTAMP)), ?, ?, ?, ?)
+           ON CONFLICT(user_id, day, category_id) DO UPDATE SET
+               income = income + excluded.income,
+               expense = expense + excluded.expense,
+               count = count + excluded.count""",
+        [(user_id, created_at, category_id, amount if income else 0, 0 if income else amount, count)
+         for category_id, (amount, count) in per_category.items()]
+    )
+
+    total = sum(amount for _, amount, _ in items)
+    _change_balance(cur, user_id, total if income else -total)
+    _bump_count(cur, user_id, type_, len(items))
+    return len(items)
+
+def _stage_deletion(cur: sqlite3.Cursor, user_id: int, condition: str, params: tuple) -> int:
+    """Отбор удаляемых транзакций во временную таблицу: все поправки считаются по одному снимку"""
+    cur.execute("""CREATE TEMP TABLE IF NOT EXISTS tx_delete (
+                       id INTEGER PRIMARY KEY, day TEXT, category_id INTEGER, type TEXT, amount REAL)""")
+    cur.execute("DELETE FROM temp.tx_delete")
+    return cur.execute(
+        f"""INSERT INTO temp.tx_delete (id, day, category_id, type, amount)
+            SELECT t.id, t.day, t.category_id, c.type, t.amount
+            FROM transactions t JOIN categories c ON t.category_id = c.id
+            WHERE t.user_id = ? AND {condition}""",
+        (user_id, *params)
+    ).rowcount
+
+def _delete_staged(cur: sqlite3.Cursor, user_id: int) -> int:
+    """Удаление отобранных транзакций и откат их влияния на итоги дня, счётчики и баланс"""
+    cur.execute(
+        """UPDATE daily_totals SET
+               income = daily_totals.income - s.income,
+               expense = daily_totals.expense - s.expense,
+               count = daily_totals.count - s.count
+           FROM (SELECT day, category_id,
+                        SUM(CASE WHEN type = 'income' THEN amount ELSE 0 END) AS income,
+                        SUM(CASE WHEN type = 'income' THEN 0 ELSE amount END) AS expense,
+                        COUNT(*) AS count
+                 FROM temp.tx_delete GROUP BY day, category_id) AS s
+           WHERE daily_totals.user_id = ? AND daily_totals.day = s.day
+             AND daily_totals.category_id = s.category_id""",
+        (user_id,)
+    )
+    cur.execute(
+        """UPDATE transaction_counts SET count = transaction_counts.count - s.count
+           FROM (SELECT type, COUNT(*) AS count FROM temp.tx_delete GROUP BY type) AS s
+           WHERE transaction_counts.user_id = ? AND transaction_counts.type = s.type""",
+        (user_id,)
+    )
+    delta = cur.execute(
+        "SELECT SUM(CASE WHEN type = 'income' THEN -amount ELSE amount END) FROM temp.tx_delete"
+    ).fetchone()[0]
+    _change_balance(cur, user_id, delta or 0)
+    deleted = cur.execute(
+        "DELETE FROM transactions WHERE user_id = ? AND id IN (SELECT id FROM temp.tx_delete)",
+        (user_id,)
+    ).rowcount
+    cur.execute("DELETE FROM daily_totals WHERE user_id = ? AND count <= 0", (user_id,))
+    cur.execute("DELETE FROM temp.tx_delete")
+    return deleted
+
+def delete_transactions(cur: sqlite3.Cursor, user_id: int, tx_ids: Iterable[int]) -> int:
+    """Удаление выбранных транзакций пользователя с откатом их влияния на баланс"""
+    ids = [int(tx_id) for tx_id in tx_ids]
+    # Список id передаётся одним JSON-параметром: размер выборки не упирается в лимит переменных SQLite
+    if not ids or not _stage_deletion(cur, user_id, "t.id IN (SELECT value FROM json_each(?))", (json.dumps(ids),)):
+        return 0
+    return _delete_staged(cur, user_id)
+
+def delete_transactions_in_range(cur: sqlite3.Cursor, user_id: int, start: str, end: str) -> int:
+    """Удаление всех транзакций пользователя за период (YYYY-MM-DD, включительно)"""
+    if not _stage_deletion(cur, user_id, "t.day BETWEEN ? AND ?", (start, end)):
+        return 0
+    return _delete_staged(cur, user_id)
+
+def delete_category(cur: sqlite3.Cursor, user_id: int, category_id: int) -> None:
+    """Удаление категории; её транзакции пропадают из отчётов, поэтому версия данных растёт.
+
+    История и выбор транзакций для удаления видят только транзакции существующих
+    категорий, поэтому они вычитаются из счётчика того же типа.
+    """
+    cur.execute(
+        """UPDATE transaction_counts
+           SET count = count - (SELECT COUNT(*) FROM transactions WHERE user_id = ?1 AND category_id = ?2)
+           WHERE user_id = ?1 AND type = (SELECT type FROM categories WHERE id = ?2 AND user_id = ?1)""",
+        (user_id, category_id)
+    )
+    cur.execute("DELETE FROM categories WHERE id = ? AND user_id = ?", (category_id, user_id))
+    cur.execute("UPDATE users SET data_version = data_version + 1 WHERE user_id = ?", (user_id,))
@@ -0,0 +1,206 @@
+"""Метрики обработки обновлений и запросов к БД в формате Prometheus"""
+import bisect
+import logging
+import time
+from collections import defaultdict, deque
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.types import TelegramObject
+
+from .config import METRICS_HOST, METRICS_PORT, METRICS_SLOW_UPDATE_MS
+from .database import QueryStats, query_stats
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм, секунды
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUANTILES = (0.5, 0.9, 0.99)
+# Сколько последних наблюдений по обработчику хранится для перцентилей
+RECENT_WINDOW = 1024
+
+
+class Histogram:
+    """Гистограмма с накопительными корзинами и окном последних значений для перцентилей"""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.recent: Deque[float] = deque(maxlen=RECENT_WINDOW)
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.recent.append(value)
+
+    def quantiles(self) -> List[Tuple[float, float]]:
+        values = sorted(self.recent)
+        if not values:
+            return []
+        return [(q, values[min(len(values) - 1, int(q * len(values)))]) for q in QUANTILES]
+
+
+class Registry:
+    """Счётчики и гистограммы с меткой handler"""
+
+    def __init__(self):
+        self.counters: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        self.histograms: Dict[str, Dict[str, Histogram]] = defaultdict(lambda: defaultdict(Histogram))
+        self.help: Dict[str, str] = {}
+
+    def inc(self, name: str, handler: str, value: float = 1.0) -> None:
+        self.counters[name][handler] += value
+
+    def observe(self, name: str, handler: str, value: float) -> None:
+        self.histograms[name][handler].observe(value)
+
+    def render(self) -> str:
+        """Текстовый формат Prometheus 0.0.4"""
+        lines = []
+        for name, series in sorted(self.counters.items()):
+            lines.append(f"# HELP {name} {self.help.get(name, name)}")
+            lines.append(f"# TYPE {name} counter")
+            for handler, value in sorted(series.items()):
+                lines.append(f'{name}{{handler="{handler}"}} {value}')
+        for name, series in sorted(self.histograms.items()):
+            lines.append(f"# HELP {name} {self.help.get(name, name)}")
+            lines.append(f"# TYPE {name} histogram")
+            for handler, hist in sorted(series.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS, hist.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{handler="{handler}",le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{handler="{handler}",le="+Inf"}} {hist.count}')
+                lines.append(f'{name}_sum{{handler="{handler}"}} {hist.sum}')
+                lines.append(f'{name}_count{{handler="{handler}"}} {hist.count}')
+            # Перцентили по последним наблюдениям - отдельной метрикой типа summary
+            recent = f"{name}_recent"
+            lines.append(f"# HELP {recent} {self.help.get(name, name)}, last {RECENT_WINDOW} updates")
+            lines.append(f"# TYPE {recent} summary")
+            for handler, hist in sorted(series.items()):
+                for q, value in hist.quantiles():
+                    lines.append(f'{recent}{{handler="{handler}",quantile="{q}"}} {value}')
+                lines.append(f'{recent}_sum{{handler="{handler}"}} {sum(hist.recent)}')
+                lines.append(f'{recent}_count{{handler="{handler}"}} {len(hist.recent)}')
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+registry.help.update({
+    "bot_updates_total": "Processed updates",
+    "bot_update_errors_total": "Updates whose handler raised",
+    "bot_slow_updates_total": "Updates slower than METRICS_SLOW_UPDATE_MS",
+    "bot_db_queries_total": "SQL statements executed while handling updates",
+    "bot_db_seconds_total": "Time spent holding a DB connection while handling updates",
+    "bot_update_duration_seconds": "Update handling wall time",
+    "bot_update_db_seconds": "DB time per update",
+})
+
+
+class _UpdateRecord:
+    __slots__ = ("handler",)
+
+    def __init__(self):
+        self.handler = "unhandled"
+
+# Обработчик текущего обновления: его заполняет внутренний middleware
+_current_update: ContextVar[Optional[_UpdateRecord]] = ContextVar("current_update", default=None)
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Внешний middleware: время обновления, число и время запросов к БД"""
+
+    def __init__(self, slow_update_ms: float = METRICS_SLOW_UPDATE_MS):
+        self.slow_update_ms = slow_update_ms
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        record = _UpdateRecord()
+        stats = QueryStats()
+        record_token = _current_update.set(record)
+        stats_token = query_stats.set(stats)
+        started = time.perf_counter()
+        failed = False
+        try:
+            return await handler(event, data)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            query_stats.reset(stats_token)
+            _current_update.reset(record_token)
+            self._record(record.handler, elapsed, stats, failed)
+
+    def _record(self, name: str, elapsed: float, stats: QueryStats, failed: bool) -> None:
+        registry.inc("bot_updates_total", name)
+        registry.observe("bot_update_duration_seconds", name, elapsed)
+        registry.observe("bot_update_db_seconds", name, stats.seconds)
+        registry.inc("bot_db_queries_total", name, stats.count)
+        registry.inc("bot_db_seconds_total", name, stats.seconds)
+        if failed:
+            registry.inc("bot_update_errors_total", name)
+        if self.slow_update_ms and elapsed * 1000 >= self.slow_update_ms:
+            registry.inc("bot_slow_updates_total", name)
+            logger.warning(
+                f"Slow update: {name} took {elapsed * 1000:.0f} ms, "
+                f"{stats.count} DB queries in {stats.seconds * 1000:.0f} ms"
+            )
+
+
+class HandlerNameMiddleware(BaseMiddleware):
+    """Внутренний middleware: запоминает, какой обработчик выбран для обновления"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        record = _current_update.get()
+        handler_object = data.get("handler")
+        if record is not None and handler_object is not None:
+            callback = handler_object.callback
+            record.handler = f"{callback.__module__}.{getattr(callback, '__name__', type(callback).__name__)}"
+        return await handler(event, data)
+
+
+_runner = None
+
+async def _start_server() -> None:
+    global _runner
+    from aiohttp import web
+
+    async def metrics_view(request: web.Request) -> web.Response:
+        return web.Response(body=registry.render().encode(),
+                            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_view)
+    _runner = web.AppRunner(app, access_log=None)
+    await _runner.setup()
+    await web.TCPSite(_runner, METRICS_HOST, METRICS_PORT).start()
+    logger.info(f"Metrics on http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+
+async def _stop_server() -> None:
+    global _runner
+    if _runner is not None:
+        await _runner.cleanup()
+        _runner = None
+
+def setup_metrics(dp: Dispatcher) -> None:
+    """Подключение middleware и HTTP-эндпоинта /metrics"""
+    # Первым в цепочке: в замер входят чтение состояния FSM и ожидание очереди пользователя
+    dp.update.outer_middleware._middlewares.insert(0, MetricsMiddleware())
+    for observer in dp.observers.values():
+        if observer.event_name not in ("update", "error"):
+            observer.middleware(HandlerNameMiddleware())
+    dp.startup.register(_start_server)
+    dp.shutdown.register(_stop_server)
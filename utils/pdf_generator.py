@@ -1,18 +1,31 @@
 
+import io
 import os
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
-from reportlab.lib.units import cm
-from reportlab.lib.utils import ImageReader
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-
-# Регистрируем шрифт с поддержкой кириллицы и Unicode
-pdfmetrics.registerFont(TTFont("DejaVu", "./fonts/ttf/DejaVuSans.ttf"))
-
-def create_pdf_report(user_id: int, summary_text: str, image_path_caption_list: list) -> str:
-    pdf_path = f"report_{user_id}.pdf"
-    c = canvas.Canvas(pdf_path, pagesize=A4)
+from functools import lru_cache
+
+# reportlab импортируется при первом отчёте: процессу бота он не нужен,
+# PDF собирается в процессах отрисовки
+
+# Шрифт ищется относительно проекта, а не текущего каталога
+FONT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fonts", "ttf", "DejaVuSans.ttf")
+
+@lru_cache(maxsize=None)
+def register_fonts() -> None:
+    """Регистрируем шрифт с поддержкой кириллицы и Unicode (один раз на процесс)"""
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+    pdfmetrics.registerFont(TTFont("DejaVu", FONT_PATH))
+
+def create_pdf_report(summary_text: str, image_caption_list: list) -> bytes:
+    """PDF-отчёт в памяти; изображения передаются как PNG-байты"""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.units import cm
+    from reportlab.lib.utils import ImageReader
+
+    register_fonts()
+    buf = io.BytesIO()
+    c = canvas.Canvas(buf, pagesize=A4)
     width, height = A4
 
     # Шрифт для текста
@@ -31,14 +44,14 @@ def create_pdf_report(user_id: int, summary_text: str, image_path_caption_list:
     c.showPage()
 
     # Остальные страницы: изображения с подписями
-    for img_path, caption in image_path_caption_list:
-        if not os.path.exists(img_path):
+    for png, caption in image_caption_list:
+        if not png:
             continue
 
         c.setFont("DejaVu", 12)
         c.drawCentredString(width / 2, height - 2 * cm, caption)
 
-        img = ImageReader(img_path)
+        img = ImageReader(io.BytesIO(png))
         iw, ih = img.getSize()
         aspect = ih / iw
 
@@ -57,4 +70,4 @@ def create_pdf_report(user_id: int, summary_text: str, image_path_caption_list:
         c.showPage()
 
     c.save()
-    return pdf_path
+    return buf.getvalue()
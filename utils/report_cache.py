@@ -0,0 +1,65 @@
+"""Кэш готовых отчётов"""
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from .config import REPORT_CACHE_MAX_ENTRIES, REPORT_CACHE_MAX_BYTES
+
+
+@dataclass
+class ReportArtifacts:
+    """Всё, что отправляется пользователю по отчёту"""
+    text_chunks: List[str]
+    csv: bytes
+    images: List[Tuple[bytes, str]]
+    pdf: bytes
+    # file_id документов, уже загруженных в Telegram: {'csv': ..., 'pdf': ...}
+    file_ids: Dict[str, str] = field(default_factory=dict)
+    csv_filename: str = "report.csv"
+
+    @property
+    def size(self) -> int:
+        return (sum(len(chunk.encode()) for chunk in self.text_chunks)
+                + len(self.csv) + len(self.pdf)
+                + sum(len(png) for png, _ in self.images))
+
+
+class ReportCache:
+    """LRU-кэш отчётов с ограничением по числу записей и суммарному размеру.
+
+    Ключ - (user_id, start, end, data_version): любая запись транзакции
+    увеличивает data_version пользователя, и старые отчёты перестают находиться.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, Tuple[ReportArtifacts, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[ReportArtifacts]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: Hashable, artifacts: ReportArtifacts) -> None:
+        size = artifacts.size
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            # Версии того же отчёта со старым data_version больше не понадобятся
+            for old_key in [k for k in self._entries if k[:-1] == key[:-1]]:
+                self._bytes -= self._entries.pop(old_key)[1]
+            self._entries[key] = (artifacts, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+
+
+report_cache = ReportCache(REPORT_CACHE_MAX_ENTRIES, REPORT_CACHE_MAX_BYTES)
@@ -0,0 +1,46 @@
+"""Запросы отчётов: суммирование выполняет SQLite, в Python приходят уже сгруппированные строки"""
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from . import db
+
+# daily_totals хранит суммы по (день, категория); у категории один тип,
+# поэтому income + expense строки - это её сумма
+
+
+async def summary_by_type(user_id: int, start: str, end: str) -> Dict[str, float]:
+    """Сумма доходов и расходов за период: {'income': ..., 'expense': ...}"""
+    rows = await db.fetchall('''
+        SELECT c.type, SUM(d.income + d.expense)
+        FROM daily_totals d
+        JOIN categories c ON d.category_id = c.id
+        WHERE d.user_id = ? AND d.day BETWEEN ? AND ?
+        GROUP BY c.type
+    ''', (user_id, start, end))
+
+    summary = defaultdict(float)
+    for type_, amount in rows:
+        summary[type_] += amount
+    return summary
+
+async def totals_by_day(user_id: int, start: str, end: str) -> List[Tuple[str, float, float]]:
+    """(YYYY-MM-DD, доход, расход) по дням с операциями"""
+    return await db.fetchall('''
+        SELECT d.day, SUM(d.income), SUM(d.expense)
+        FROM daily_totals d
+        JOIN categories c ON d.category_id = c.id
+        WHERE d.user_id = ? AND d.day BETWEEN ? AND ?
+        GROUP BY d.day
+        ORDER BY d.day
+    ''', (user_id, start, end))
+
+async def totals_by_month(user_id: int, start: str, end: str) -> List[Tuple[str, float, float]]:
+    """(YYYY-MM, доход, расход) по месяцам с операциями"""
+    return await db.fetchall('''
+        SELECT strftime('%Y-%m', d.day) AS month, SUM(d.income), SUM(d.expense)
+        FROM daily_totals d
+        JOIN categories c ON d.category_id = c.id
+        WHERE d.user_id = ? AND d.day BETWEEN ? AND ?
+        GROUP BY month
+        ORDER BY month
+    ''', (user_id, start, end))
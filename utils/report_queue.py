@@ -0,0 +1,45 @@
+"""Очередь построения отчётов"""
+import logging
+from typing import Awaitable, Callable, Hashable, List, Set
+
+from .config import REPORT_MAX_CONCURRENT
+from .keyed_locks import KeyedLocks
+
+logger = logging.getLogger(__name__)
+
+
+class ReportScheduler:
+    """Общий лимит одновременных отчётов, очередь по пользователям и склейка одинаковых запросов"""
+
+    def __init__(self, max_concurrent: int):
+        # Отчёты одного пользователя строятся по очереди
+        self._user_locks = KeyedLocks(max_concurrent)
+        self._pending: Set[Hashable] = set()
+        self._queue: List[Hashable] = []
+
+    async def submit(
+        self,
+        user_id: int,
+        key: Hashable,
+        job: Callable[[], Awaitable[None]],
+        on_queued: Callable[[int], Awaitable[None]]
+    ) -> bool:
+        """Выполнить job в порядке очереди. False - такой же отчёт уже в работе"""
+        if key in self._pending:
+            return False
+        self._pending.add(key)
+        self._queue.append(key)
+        try:
+            if self._user_locks.busy(user_id):
+                await on_queued(self._queue.index(key) + 1)
+            async with self._user_locks.hold(user_id):
+                self._queue.remove(key)
+                await job()
+        finally:
+            self._pending.discard(key)
+            if key in self._queue:
+                self._queue.remove(key)
+        return True
+
+
+report_scheduler = ReportScheduler(REPORT_MAX_CONCURRENT)
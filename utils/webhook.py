@@ -0,0 +1,69 @@
+"""Приём обновлений через вебхук на aiohttp-сервере aiogram"""
+import asyncio
+import logging
+from typing import Any, Dict
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+from .config import (
+    WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_URL, WEBHOOK_SECRET, WEBHOOK_MAX_CONCURRENT
+)
+
+logger = logging.getLogger(__name__)
+
+
+class BoundedRequestHandler(SimpleRequestHandler):
+    """Обработчик вебхука с ограничением одновременно обрабатываемых обновлений.
+
+    Слот занимается до ответа Telegram: при перегрузке запрос ждёт,
+    и Telegram притормаживает доставку, а не копятся фоновые задачи.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, max_concurrent: int, **kwargs: Any):
+        super().__init__(dispatcher, bot, handle_in_background=True, **kwargs)
+        self._semaphore = asyncio.Semaphore(max(1, max_concurrent))
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        await self._semaphore.acquire()
+        try:
+            return await super()._handle_request_background(bot, request)
+        except BaseException:
+            # Задача не создана - слот освобождаем сразу
+            self._semaphore.release()
+            raise
+
+    async def _background_feed_update(self, bot: Bot, update: Dict[str, Any]) -> None:
+        try:
+            await super()._background_feed_update(bot, update)
+        finally:
+            self._semaphore.release()
+
+
+async def _register_webhook(bot: Bot) -> None:
+    if not WEBHOOK_URL:
+        logger.info("WEBHOOK_URL не задан, setWebhook не вызывается")
+        return
+    await bot.set_webhook(
+        WEBHOOK_URL,
+        secret_token=WEBHOOK_SECRET or None,
+        max_connections=WEBHOOK_MAX_CONCURRENT
+    )
+    logger.info(f"Webhook set to {WEBHOOK_URL}")
+
+def create_app(dp: Dispatcher, bot: Bot) -> web.Application:
+    """aiohttp-приложение с маршрутом вебхука и запуском/остановкой диспетчера"""
+    app = web.Application()
+    BoundedRequestHandler(
+        dp, bot,
+        max_concurrent=WEBHOOK_MAX_CONCURRENT,
+        secret_token=WEBHOOK_SECRET or None
+    ).register(app, path=WEBHOOK_PATH)
+    dp.startup.register(_register_webhook)
+    setup_application(app, dp, bot=bot)
+    return app
+
+def run_webhook(dp: Dispatcher, bot: Bot) -> None:
+    logger.info(f"Webhook server on {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+    web.run_app(create_app(dp, bot), host=WEBHOOK_HOST, port=WEBHOOK_PORT, print=None)